@@ -1,8 +1,16 @@
 __version__ = "0.2.1"
 
-from .messages import NKRequest, NKResponse
+from .messages import NKRequest, NKResponse, NKStreamingResponse, NKHTTPError
 from .router import NKRouter
+from .deadline import NKDeadline
+from .metrics import NKMetrics
+from .profiling import NKProfiler
 from .server import NKServer, NKRequestHandler
-from .database import NKDBSqlite3
+from .accesslog import NKAccessLogger
+from .tasks import NKTaskQueue
+from .testing import NKTestClient, NKTestResponse
+from .admission import NKAdmissionController
+from .ratelimit import NKRateLimiter, NKMemoryBucketStore, NKSqliteBucketStore
+from .database import NKDBSqlite3, NKDBSqlite3Async, NKDBSqlite3Replica, NKResultCache, NKColumns, NKRow
 
-__all__ = ["NKRequest", "NKResponse", "NKRouter", "NKServer", "NKRequestHandler", "NKDBSqlite3"]
+__all__ = ["NKRequest", "NKResponse", "NKStreamingResponse", "NKHTTPError", "NKRouter", "NKDeadline", "NKMetrics", "NKProfiler", "NKServer", "NKRequestHandler", "NKAccessLogger", "NKTaskQueue", "NKTestClient", "NKTestResponse", "NKAdmissionController", "NKRateLimiter", "NKMemoryBucketStore", "NKSqliteBucketStore", "NKDBSqlite3", "NKDBSqlite3Async", "NKDBSqlite3Replica", "NKResultCache", "NKColumns", "NKRow"]
@@ -0,0 +1,141 @@
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import datetime
+import threading
+
+from . import utils
+
+class NKAccessLogger:
+    formats = ("console", "common", "json")
+
+    def __init__(self, format="console", stream=None, sample_rate=1.0, batch_size=256, flush_interval=0.5, queue_size=10000):
+        if format not in self.formats:
+            raise ValueError(f"unknown access log format: {format}")
+        self.format = format
+        self.stream = stream
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.written = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def log(self, client, method, path, version, status, size=None, duration=None):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            try:
+                if int(status) < 500:
+                    return
+            except (TypeError, ValueError):
+                return
+        self._put((time.time(), client, method, path, version, status, size, duration))
+
+    def message(self, text):
+        self._put((time.time(), text))
+
+    def _put(self, record):
+        if self._thread is None:
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="nkapi-access-log", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [record]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            self._write([r for r in batch if r is not None])
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                return
+
+    def _write(self, records):
+        if not records:
+            return
+        stream = self.stream or sys.stdout
+        try:
+            stream.write("".join(self.render(record) + "\n" for record in records))
+            stream.flush()
+            self.written += len(records)
+        except (OSError, ValueError):
+            pass
+
+    def render(self, record):
+        if len(record) == 2:
+            timestamp, text = record
+            if self.format == "json":
+                return json.dumps({"time": timestamp, "message": text})
+            return f"* {text}"
+
+        timestamp, client, method, path, version, status, size, duration = record
+        size_text = "-" if size is None else str(size)
+
+        if self.format == "json":
+            return json.dumps({
+                "time": timestamp,
+                "client": client,
+                "method": method,
+                "path": path,
+                "version": version,
+                "status": status,
+                "size": size,
+                "duration": duration
+            })
+
+        if self.format == "common":
+            moment = datetime.datetime.fromtimestamp(timestamp).astimezone()
+            return f"{client} - - [{moment.strftime('%d/%b/%Y:%H:%M:%S %z')}] \"{method} {path} {version}\" {status} {size_text}"
+
+        moment = datetime.datetime.fromtimestamp(timestamp)
+        a = utils.ANSI
+        color = {
+            "2": a.WHITE, "3": a.CYAN, "4": a.YELLOW, "5": a.MAGENTA
+        }.get(str(status)[0], "")
+        duration_text = "-" if duration is None else f"{duration * 1000:.1f}ms"
+        return (
+            f"{client} - - [{moment.strftime('%I:%M:%S %p %m/%d/%Y')}] "
+            f"\"{color}{method} {path} {version}{a.RESET}\" {status} {size_text} {duration_text}"
+        )
+
+    def flush(self, timeout=None):
+        if self._thread is None:
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            time.sleep(0.005)
+
+    def close(self, timeout=2.0):
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+        self._thread = None
@@ -0,0 +1,137 @@
+import math
+import time
+import threading
+
+from .messages import NKRequest, NKResponse
+
+priority_classes = {"critical": 0, "normal": 1, "low": 2}
+
+class NKAdmissionController:
+    def __init__(self, limit=64, min_limit=4, max_limit=1024, adaptive=True, queue_timeout=0.05, target_delay=0.005, interval=0.1, retry_after=1, priorities=None, low_priority_share=0.5, smoothing=0.2):
+        self.limit = float(limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.adaptive = adaptive
+        self.queue_timeout = queue_timeout
+        self.target_delay = target_delay
+        self.interval = interval
+        self.retry_after = retry_after
+        self.low_priority_share = low_priority_share
+        self.smoothing = smoothing
+        self.priorities = sorted(
+            ((prefix, priority_classes[name]) for prefix, name in (priorities or {}).items()),
+            key=lambda item: len(item[0]),
+            reverse=True
+        )
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.dropping = False
+        self.first_above_time = None
+        self.rtt_noload = None
+        self.rtt = None
+        self.samples = 0
+
+    def priority(self, request: NKRequest):
+        for prefix, priority in self.priorities:
+            if request.path.startswith(prefix):
+                return priority
+        return priority_classes["normal"]
+
+    def _capacity(self, priority):
+        if priority == priority_classes["low"]:
+            return max(1, int(self.limit * self.low_priority_share))
+        return max(1, int(self.limit))
+
+    def acquire(self, priority):
+        with self.condition:
+            if priority == priority_classes["critical"]:
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+
+            capacity = self._capacity(priority)
+            if self.in_flight < capacity:
+                self.in_flight += 1
+                self.admitted += 1
+                self._observe_delay(0.0)
+                return True
+
+            if self.dropping or self.queue_timeout <= 0:
+                self.rejected += 1
+                return False
+
+            start_time = time.perf_counter()
+            deadline = start_time + self.queue_timeout
+            while self.in_flight >= self._capacity(priority):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self._observe_delay(time.perf_counter() - start_time)
+                    self.rejected += 1
+                    return False
+                self.condition.wait(remaining)
+
+            self.in_flight += 1
+            self.admitted += 1
+            self._observe_delay(time.perf_counter() - start_time)
+            return True
+
+    def _observe_delay(self, delay):
+        now = time.monotonic()
+        if delay < self.target_delay:
+            self.first_above_time = None
+            self.dropping = False
+        elif self.first_above_time is None:
+            self.first_above_time = now + self.interval
+        elif now >= self.first_above_time:
+            self.dropping = True
+
+    def release(self, latency):
+        with self.condition:
+            self.in_flight -= 1
+            if self.adaptive:
+                self._update_limit(latency)
+            self.condition.notify_all()
+
+    def _update_limit(self, latency):
+        self.samples += 1
+        if self.rtt_noload is None or latency < self.rtt_noload or self.samples % 1000 == 0:
+            self.rtt_noload = latency
+        self.rtt = latency if self.rtt is None else self.rtt * 0.9 + latency * 0.1
+        if self.rtt <= 0:
+            return
+        gradient = max(0.5, min(1.0, self.rtt_noload / self.rtt))
+        target = self.limit * gradient + math.sqrt(self.limit)
+        limit = self.limit * (1 - self.smoothing) + target * self.smoothing
+        self.limit = float(min(self.max_limit, max(self.min_limit, limit)))
+
+    def overloaded_response(self):
+        return NKResponse(
+            status=503,
+            headers={"Retry-After": self.retry_after},
+            body="503 Service Unavailable"
+        )
+
+    def stats(self):
+        with self.condition:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "dropping": self.dropping,
+                "rtt": self.rtt,
+                "rtt_noload": self.rtt_noload
+            }
+
+    def __call__(self, next_handler):
+        def handler(request: NKRequest):
+            if not self.acquire(self.priority(request)):
+                return self.overloaded_response()
+            start_time = time.perf_counter()
+            try:
+                return next_handler(request)
+            finally:
+                self.release(time.perf_counter() - start_time)
+        return handler
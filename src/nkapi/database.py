@@ -1,30 +1,486 @@
 import re
+import json
 import time
+import array
+import base64
+import asyncio
 import sqlite3
+import functools
+import contextlib
+import itertools
+import urllib.parse
 import threading
+import collections
+import concurrent.futures
+
+from .messages import NKStreamingResponse, NKHTTPError
+from .deadline import current_deadline
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 identifier_pattern = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+literal_pattern = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+whitespace_pattern = re.compile(r"\s+")
+read_table_pattern = re.compile(r'\b(?:FROM|JOIN)\s+"?([A-Za-z_][A-Za-z0-9_]*)"?', re.IGNORECASE)
+write_table_pattern = re.compile(
+    r'\b(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM'
+    r'|DROP\s+TABLE(?:\s+IF\s+EXISTS)?|ALTER\s+TABLE)\s+"?([A-Za-z_][A-Za-z0-9_]*)"?',
+    re.IGNORECASE
+)
+scan_pattern = re.compile(r'^SCAN (?:TABLE )?([A-Za-z_][A-Za-z0-9_]*)(?: AS \w+)?\s*$')
+where_clause_pattern = re.compile(r"\bWHERE\b(.*?)(?:\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|;|$)", re.IGNORECASE | re.DOTALL)
+order_clause_pattern = re.compile(r"\bORDER\s+BY\b(.*?)(?:\bLIMIT\b|;|$)", re.IGNORECASE | re.DOTALL)
+equality_pattern = re.compile(r'"?([A-Za-z_][A-Za-z0-9_]*)"?\s*(?:==?|\bIS\b(?!\s+NOT)|\bIN\b)', re.IGNORECASE)
+range_pattern = re.compile(r'"?([A-Za-z_][A-Za-z0-9_]*)"?\s*(?:<=?|>=?|\bBETWEEN\b|\bLIKE\b)', re.IGNORECASE)
+column_reference_pattern = re.compile(r'"?([A-Za-z_][A-Za-z0-9_]*)"?')
+checkpoint_modes = ("PASSIVE", "FULL", "RESTART", "TRUNCATE")
+pragma_profiles = {
+    "default": {},
+    "read_heavy": {
+        "page_size": 4096,
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+        "wal_autocheckpoint": 1000
+    },
+    "write_heavy": {
+        "page_size": 4096,
+        "cache_size": -32768,
+        "mmap_size": 134217728,
+        "temp_store": "MEMORY",
+        "busy_timeout": 10000,
+        "wal_autocheckpoint": 4000
+    },
+    "bulk_load": {
+        "page_size": 65536,
+        "cache_size": -262144,
+        "mmap_size": 0,
+        "temp_store": "MEMORY",
+        "busy_timeout": 30000,
+        "wal_autocheckpoint": 0
+    },
+    "low_memory": {
+        "page_size": 4096,
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "temp_store": "FILE",
+        "busy_timeout": 5000,
+        "wal_autocheckpoint": 1000
+    }
+}
+write_actions = frozenset((sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE, sqlite3.SQLITE_DELETE))
+read_only_statements = {"SELECT", "EXPLAIN", "PRAGMA", "BEGIN", "COMMIT", "END", "SAVEPOINT", "RELEASE", "ANALYZE", "CREATE"}
+
+def resolve_profile(profile):
+    if isinstance(profile, str):
+        if profile not in pragma_profiles:
+            raise ValueError(f"unknown pragma profile: {profile}")
+        return profile, pragma_profiles[profile]
+    return "custom", dict(profile)
+
+@functools.lru_cache(maxsize=1024)
+def normalize_query(query):
+    query = literal_pattern.sub("?", query)
+    query = whitespace_pattern.sub(" ", query).strip()
+    return query.rstrip(";").rstrip()
+
+@functools.lru_cache(maxsize=1024)
+def referenced_tables(query):
+    return frozenset(name.lower() for name in read_table_pattern.findall(query))
+
+@functools.lru_cache(maxsize=1024)
+def written_tables(query):
+    statement = query.lstrip().split(None, 1)[0].upper() if query.strip() else ""
+    if statement in read_only_statements:
+        return frozenset()
+    tables = frozenset(name.lower() for name in write_table_pattern.findall(query))
+    if statement == "WITH":
+        return tables
+    return tables or None
+
+@functools.lru_cache(maxsize=1024)
+def changes_schema(query):
+    statement = query.lstrip().split(None, 1)[0].upper() if query.strip() else ""
+    return statement in ("CREATE", "DROP", "ALTER", "ROLLBACK")
+
+def estimate_size(rows):
+    size = 56
+    for row in rows:
+        size += 56
+        for value in row:
+            if isinstance(value, (str, bytes)):
+                size += 49 + len(value)
+            else:
+                size += 24
+    return size
+
+class NKResultCache:
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, ttl=60.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.tables = {}
+        self.bytes = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[3]
+
+    def put(self, key, rows, tables, generation):
+        size = estimate_size(rows)
+        with self.lock:
+            if generation != self.generation or size > self.max_bytes:
+                return
+            if key in self.entries:
+                self._remove(key)
+            expires = time.monotonic() + self.ttl if self.ttl else None
+            self.entries[key] = (expires, size, tables, rows)
+            for table in tables:
+                self.tables.setdefault(table, set()).add(key)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, tables, _ = self.entries.pop(key)
+        self.bytes -= size
+        for table in tables:
+            keys = self.tables.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tables[table]
+
+    def invalidate(self, table=None):
+        with self.lock:
+            self.generation += 1
+            self.invalidations += 1
+            if table is None:
+                self.entries.clear()
+                self.tables.clear()
+                self.bytes = 0
+                return
+            for key in list(self.tables.get(table.lower(), ())):
+                self._remove(key)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+def extend_column(column, values):
+    if isinstance(column, array.array):
+        length = len(column)
+        try:
+            column.extend(values)
+            return column
+        except (TypeError, OverflowError):
+            del column[length:]
+        if column.typecode == "q" and all(type(v) in (int, float, bool) for v in values):
+            try:
+                column = array.array("d", column)
+                column.extend(values)
+                return column
+            except OverflowError:
+                pass
+        column = column.tolist()
+    column.extend(values)
+    return column
+
+def encode_page_token(values):
+    raw = json.dumps(list(values), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+def decode_page_token(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw.decode("utf-8"))
+    except (ValueError, TypeError):
+        raise ValueError("invalid pagination token")
+    if not isinstance(values, list) or not all(v is None or isinstance(v, (str, int, float)) for v in values):
+        raise ValueError("invalid pagination token")
+    return values
+
+class NKRow(tuple):
+    __slots__ = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self._index[key]
+        return tuple.__getitem__(self, key)
+
+    def keys(self):
+        return list(self._index)
+
+    def get(self, key, default=None):
+        index = self._index.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def as_dict(self):
+        return dict(zip(self._index, self))
+
+class NKColumns:
+    def __init__(self, names, columns):
+        self.names = list(names)
+        self.columns = dict(zip(self.names, columns))
+        self.row_type = type("NKRow", (NKRow,), {"__slots__": (), "_index": {name: i for i, name in enumerate(self.names)}})
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self.row_type(column[key] for column in self.columns.values())
+        return self.columns[key]
+
+    def __iter__(self):
+        return self.rows()
+
+    def rows(self):
+        row_type = self.row_type
+        for values in zip(*self.columns.values()):
+            yield row_type(values)
+
+    def to_dict(self):
+        return {
+            name: column.tolist() if hasattr(column, "tolist") else list(column)
+            for name, column in self.columns.items()
+        }
+
+    def __str__(self):
+        return f"<nkapi.NKColumns - {len(self)} rows x {len(self.names)} columns>"
+
+    def __repr__(self):
+        return self.__str__()
+
+class QueryStats:
+    def __init__(self, sample_size=1024):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.samples = collections.deque(maxlen=sample_size)
+
+    def record(self, duration, rows):
+        self.count += 1
+        self.total += duration
+        self.rows += rows
+        if duration > self.max:
+            self.max = duration
+        self.samples.append(duration)
+
+    def add_fetch(self, duration, rows):
+        self.total += duration
+        self.rows += rows
+        if self.samples:
+            self.samples[-1] += duration
+            if self.samples[-1] > self.max:
+                self.max = self.samples[-1]
+
+    def percentile(self, fraction):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+        return ordered[index]
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "max": self.max,
+            "rows": self.rows
+        }
 
 class NKDBSqlite3:
-    def __init__(self, database="./db.sqlite3", timeout=5.0, return_dicts=False, journal_mode="WAL", synchronous="NORMAL"):
+    def __init__(self, database="./db.sqlite3", timeout=5.0, return_dicts=False, journal_mode="WAL", synchronous="NORMAL", slow_query_threshold=None, slow_query_log_size=100, statement_cache_size=256, result_cache=None, profile=None, check_columns=False, schema_check_interval=1.0):
         self.database = database
         self.timeout = timeout
         self.return_dicts = return_dicts
         self.verbose_query_output = False
+        self.collect_query_stats = True
+        self.slow_query_threshold = slow_query_threshold
+        self.slow_query_log = collections.deque(maxlen=slow_query_log_size)
+        self._query_stats = {}
+        self._pending_query = None
+        self.statement_cache_size = statement_cache_size
+        self._sql_cache = collections.OrderedDict()
+        self._sql_cache_hits = 0
+        self._sql_cache_misses = 0
+        self.result_cache = NKResultCache() if result_cache is True else result_cache
+        self._written = None
+        self._write_targets = collections.OrderedDict()
+        self._write_targets_size = max(1024, 2 * int(statement_cache_size))
+        self.check_columns = check_columns
+        self.schema_check_interval = schema_check_interval
+        self._schema = None
+        self.profile = None
+        self.profile_pragmas = {}
+        self.checkpoint_stats = {"count": 0, "busy": 0, "total": 0.0, "last": None, "modes": {}}
+        self._checkpoint_lock = threading.Lock()
+        self._checkpoint_thread = None
+        self._checkpoint_stop = threading.Event()
         self.lock = threading.RLock()
-        self.connection_arguments = {"timeout": float(self.timeout), "check_same_thread": False}
+        self.connection_arguments = {
+            "timeout": float(self.timeout),
+            "check_same_thread": False,
+            "cached_statements": int(statement_cache_size)
+        }
         self._connect()
         self.execute_pragma("foreign_keys = ON", commit=False)
+        profile_pragmas = resolve_profile(profile)[1] if profile else {}
+        if "page_size" in profile_pragmas:
+            self.execute_pragma(f"page_size = {int(profile_pragmas['page_size'])}", commit=False)
         if journal_mode:
             self.execute_pragma(f"journal_mode = {journal_mode}", commit=False)
         if synchronous:
             self.execute_pragma(f"synchronous = {synchronous}", commit=False)
+        if profile:
+            self.apply_profile(profile)
+
+    def _open_connection(self):
+        return sqlite3.connect(self.database, **self.connection_arguments)
 
     def _connect(self):
-        self.connection = sqlite3.connect(self.database, **self.connection_arguments)
+        self.connection = self._open_connection()
         if self.return_dicts:
             self.connection.row_factory = sqlite3.Row
         self.cursor = self.connection.cursor()
+        if self.result_cache is not None:
+            self.connection.set_authorizer(self._authorize)
+        for key, value in self.profile_pragmas.items():
+            self.cursor.execute(f"PRAGMA {key} = {value};")
+
+    def apply_profile(self, profile, vacuum=False):
+        name, pragmas = resolve_profile(profile)
+        with self.lock:
+            if "page_size" in pragmas:
+                self._set_page_size(int(pragmas["page_size"]), vacuum)
+            for key, value in pragmas.items():
+                if key == "page_size":
+                    continue
+                self._quote_identifier(key)
+                self.execute_pragma(f"{key} = {value}", commit=False)
+            self.profile = name
+            self.profile_pragmas = {k: v for k, v in pragmas.items() if k != "page_size"}
+            return self.pragma_values(pragmas.keys())
+
+    def _set_page_size(self, page_size, vacuum=False):
+        current = self.pragma_values(["page_size", "journal_mode"])
+        if current["page_size"] == page_size:
+            return
+        if not vacuum:
+            self.execute_pragma(f"page_size = {page_size}", commit=False)
+            return
+        wal = str(current["journal_mode"]).lower() == "wal"
+        self.connection.commit()
+        if wal:
+            self.execute_pragma("journal_mode = DELETE", commit=False)
+        self.execute_pragma(f"page_size = {page_size}", commit=False)
+        self.execute("VACUUM;")
+        if wal:
+            self.execute_pragma("journal_mode = WAL", commit=False)
+
+    def pragma_values(self, names):
+        with self.lock:
+            values = {}
+            for name in names:
+                self._quote_identifier(name)
+                rows = self.execute_pragma(name, commit=False)
+                values[name] = rows[0][0] if rows else None
+            return values
+
+    def _checkpoint(self, connection, mode):
+        mode = mode.upper()
+        if mode not in checkpoint_modes:
+            raise ValueError(f"invalid checkpoint mode: {mode}")
+        start_time = time.perf_counter()
+        busy, log_pages, checkpointed_pages = connection.execute(f"PRAGMA wal_checkpoint({mode});").fetchone()
+        duration = time.perf_counter() - start_time
+        result = {
+            "mode": mode,
+            "busy": bool(busy),
+            "log_pages": log_pages,
+            "checkpointed_pages": checkpointed_pages,
+            "duration": duration,
+            "timestamp": time.time()
+        }
+        with self._checkpoint_lock:
+            stats = self.checkpoint_stats
+            stats["count"] += 1
+            stats["busy"] += int(bool(busy))
+            stats["total"] += duration
+            stats["last"] = result
+            stats["modes"][mode] = stats["modes"].get(mode, 0) + 1
+        return result
+
+    def checkpoint(self, mode="PASSIVE"):
+        with self.lock:
+            self._ensure_open()
+            return self._checkpoint(self.connection, mode)
+
+    def start_checkpoint_scheduler(self, interval=30.0, mode="PASSIVE", truncate_threshold=10000):
+        if self._checkpoint_thread is not None and self._checkpoint_thread.is_alive():
+            return self._checkpoint_thread
+        self._checkpoint_stop.clear()
+
+        def run():
+            connection = sqlite3.connect(self.database, timeout=float(self.timeout), check_same_thread=False)
+            try:
+                while not self._checkpoint_stop.wait(interval):
+                    try:
+                        result = self._checkpoint(connection, mode)
+                        if truncate_threshold and result["log_pages"] >= truncate_threshold:
+                            self._checkpoint(connection, "TRUNCATE")
+                    except sqlite3.Error as error:
+                        print(f"* [NKDBSqlite3] checkpoint failed: {error}")
+            finally:
+                connection.close()
+
+        self._checkpoint_thread = threading.Thread(target=run, name="nkdb-checkpoint", daemon=True)
+        self._checkpoint_thread.start()
+        return self._checkpoint_thread
+
+    def stop_checkpoint_scheduler(self, timeout=None):
+        self._checkpoint_stop.set()
+        thread = self._checkpoint_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        self._checkpoint_thread = None
 
     def _ensure_open(self):
         if getattr(self, "connection", None) is None:
@@ -35,25 +491,253 @@ class NKDBSqlite3:
             raise ValueError("invalid identifier")
         return f'"{identifier}"'
 
+    def _cached_sql(self, key, build, *args):
+        query = self._sql_cache.get(key)
+        if query is not None:
+            self._sql_cache_hits += 1
+            self._sql_cache.move_to_end(key)
+            return query
+        self._sql_cache_misses += 1
+        query = build(*args)
+        if self.statement_cache_size > 0:
+            self._sql_cache[key] = query
+            if len(self._sql_cache) > self.statement_cache_size:
+                self._sql_cache.popitem(last=False)
+        return query
+
+    def statement_cache_stats(self):
+        with self.lock:
+            lookups = self._sql_cache_hits + self._sql_cache_misses
+            return {
+                "size": len(self._sql_cache),
+                "capacity": self.statement_cache_size,
+                "hits": self._sql_cache_hits,
+                "misses": self._sql_cache_misses,
+                "hit_rate": self._sql_cache_hits / lookups if lookups else 0.0
+            }
+
+    def clear_statement_cache(self):
+        with self.lock:
+            self._sql_cache.clear()
+            self._sql_cache_hits = 0
+            self._sql_cache_misses = 0
+
+    def _build_select(self, table_name, columns, where, order_by, limit):
+        if isinstance(columns, (list, tuple)):
+            column_string = ", ".join(
+                [self._quote_identifier(c) if identifier_pattern.match(c) else c for c in columns]
+            )
+        else:
+            column_string = columns
+        query = f"SELECT {column_string} FROM {self._quote_identifier(table_name)}"
+        if where:
+            query += f" WHERE {where}"
+        if order_by:
+            query += f" ORDER BY {order_by}"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        return query + ";"
+
+    def _build_insert(self, table_name, keys):
+        placeholders = ", ".join(["?"] * len(keys))
+        quoted_keys = ", ".join(self._quote_identifier(k) for k in keys)
+        return f"INSERT INTO {self._quote_identifier(table_name)} ({quoted_keys}) VALUES ({placeholders});"
+
+    def _build_update(self, table_name, keys, where):
+        set_clause = ", ".join([f"{self._quote_identifier(k)} = ?" for k in keys])
+        query = f"UPDATE {self._quote_identifier(table_name)} SET {set_clause}"
+        if where:
+            query += f" WHERE {where}"
+        return query + ";"
+
+    def _build_delete(self, table_name, where):
+        query = f"DELETE FROM {self._quote_identifier(table_name)}"
+        if where:
+            query += f" WHERE {where}"
+        return query + ";"
+
+    @contextlib.contextmanager
+    def _deadline_guard(self, deadline):
+        if deadline is None:
+            yield
+            return
+        if deadline.expired():
+            raise sqlite3.OperationalError("deadline exceeded")
+        self.connection.set_progress_handler(deadline.progress_handler, 1000)
+        try:
+            yield
+        finally:
+            self.connection.set_progress_handler(None, 0)
+
+    def _run(self, query, parameters=(), fetch=False, many=False):
+        written = collected = None
+        if not fetch and self.result_cache is not None:
+            written = self._write_targets.get(query)
+            if written is None:
+                self._written = set()
+            else:
+                self._write_targets.move_to_end(query)
+        start_time = time.perf_counter()
+        rows = None
+        try:
+            with self._deadline_guard(current_deadline()):
+                if many:
+                    self.cursor.executemany(query, parameters)
+                elif parameters:
+                    self.cursor.execute(query, parameters)
+                else:
+                    self.cursor.execute(query)
+                if fetch:
+                    rows = self.cursor.fetchall()
+        finally:
+            collected, self._written = self._written, None
+        if collected is not None:
+            written = self._remember_writes(query, collected)
+        duration = time.perf_counter() - start_time
+        if not fetch:
+            if self.result_cache is not None:
+                if written is None:
+                    self.result_cache.invalidate()
+                else:
+                    self._invalidate_results(query, written)
+            if changes_schema(query):
+                self._schema = None
+                self._write_targets.clear()
+        row_count = len(rows) if rows is not None else max(self.cursor.rowcount, 0)
+        self._record_query(query, None if many else parameters, duration, row_count)
+        self._pending_query = query if not fetch and self.cursor.description is not None else None
+        return rows if fetch else self.cursor
+
+    def _record_query(self, query, parameters, duration, rows):
+        if self.collect_query_stats:
+            key = normalize_query(query)
+            stats = self._query_stats.get(key)
+            if stats is None:
+                stats = self._query_stats[key] = QueryStats()
+            stats.record(duration, rows)
+        if self.slow_query_threshold is not None and duration >= self.slow_query_threshold:
+            self.slow_query_log.append({
+                "query": query,
+                "parameters": parameters,
+                "duration": duration,
+                "rows": rows,
+                "plan": self.explain(query, parameters) if parameters is not None else None,
+                "timestamp": time.time()
+            })
+
+    def _record_fetch(self, query, duration, rows):
+        if query is None or not self.collect_query_stats:
+            return
+        stats = self._query_stats.get(normalize_query(query))
+        if stats is not None:
+            stats.add_fetch(duration, rows)
+
+    def _remember_writes(self, query, collected):
+        if not collected and written_tables(query) != frozenset():
+            return None
+        written = frozenset(collected)
+        self._write_targets[query] = written
+        while len(self._write_targets) > self._write_targets_size:
+            self._write_targets.popitem(last=False)
+        return written
+
+    def _authorize(self, action, table, column, database, trigger):
+        if self._written is not None and action in write_actions and table:
+            self._written.add(table.lower())
+        return sqlite3.SQLITE_OK
+
+    def _invalidate_results(self, query, written=None):
+        tables = written_tables(query)
+        if written:
+            tables = written | (tables or frozenset())
+        if tables is None:
+            self.result_cache.invalidate()
+        for table in tables or ():
+            self.result_cache.invalidate(table)
+
+    def _format_rows(self, rows):
+        if self.return_dicts:
+            return [dict(r) for r in rows]
+        return list(rows)
+
+    def explain(self, query, parameters=()):
+        with self.lock:
+            self._ensure_open()
+            cursor = self.connection.cursor()
+            try:
+                cursor.execute(f"EXPLAIN QUERY PLAN {query}", parameters or ())
+                return [row[3] for row in cursor.fetchall()]
+            except sqlite3.Error:
+                return None
+            finally:
+                cursor.close()
+
+    def query_stats(self):
+        with self.lock:
+            return {key: stats.as_dict() for key, stats in self._query_stats.items()}
+
+    def reset_query_stats(self):
+        with self.lock:
+            self._query_stats.clear()
+            self.slow_query_log.clear()
+
     def execute_pragma(self, pragma_statement, commit=False):
         with self.lock:
             self._ensure_open()
             query = f"PRAGMA {pragma_statement};"
             if self.verbose_query_output:
                 print(f"* [NKDBSqlite3] {query}")
-            self.cursor.execute(query)
+            rows = self._run(query, fetch=True)
             if commit:
                 self.connection.commit()
-            return self.cursor.fetchall()
+            return rows
+
+    def _schema_cache(self):
+        now = time.monotonic()
+        schema = self._schema
+        if schema is not None and now - schema["checked"] < self.schema_check_interval:
+            return schema
+        self._ensure_open()
+        version = self._run("PRAGMA schema_version;", fetch=True)[0][0]
+        if schema is None or schema["version"] != version:
+            query = "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;"
+            if self.verbose_query_output:
+                print(f"* [NKDBSqlite3] {query}")
+            tables = {row[0].lower(): {"name": row[0], "columns": None} for row in self._run(query, fetch=True)}
+            schema = self._schema = {"version": version, "tables": tables}
+        schema["checked"] = now
+        return schema
+
+    def _load_columns(self, table_name):
+        query = f"PRAGMA table_info({self._quote_identifier(table_name)});"
+        if self.verbose_query_output:
+            print(f"* [NKDBSqlite3] {query}")
+        rows = self._run(query, fetch=True)
+        return {
+            row[1]: {
+                "type": row[2],
+                "notnull": bool(row[3]),
+                "default": row[4],
+                "primary_key": bool(row[5])
+            }
+            for row in rows
+        }
+
+    def invalidate_schema(self):
+        with self.lock:
+            self._schema = None
+
+    def validate_columns(self, table_name, columns):
+        known = self.table_columns(table_name)
+        if not known:
+            raise ValueError(f"unknown table: {table_name}")
+        unknown = [c for c in columns if c not in known]
+        if unknown:
+            raise ValueError(f"unknown column(s) for {table_name}: {', '.join(map(str, unknown))}")
 
     def table_exists(self, table_name):
         with self.lock:
-            self._ensure_open()
-            query = "SELECT name FROM sqlite_master WHERE type='table' AND name=?;"
-            if self.verbose_query_output:
-                print(f"* [NKDBSqlite3] {query} params=({table_name!r},)")
-            self.cursor.execute(query, (table_name,))
-            return self.cursor.fetchone() is not None
+            return str(table_name).lower() in self._schema_cache()["tables"]
 
     def table_create(self, table_name, column_definitions, if_not_exists=True):
         quoted_table = self._quote_identifier(table_name)
@@ -74,61 +758,375 @@ class NKDBSqlite3:
         self.execute(query, (), commit=True)
 
     def table_list(self):
+        with self.lock:
+            return [table["name"] for table in self._schema_cache()["tables"].values()]
+
+    def table_columns(self, table_name):
+        with self.lock:
+            self._quote_identifier(table_name)
+            table = self._schema_cache()["tables"].get(table_name.lower())
+            if table is None:
+                return {}
+            if table["columns"] is None:
+                table["columns"] = self._load_columns(table["name"])
+            return dict(table["columns"])
+
+    def index_create(self, index_name, table_name, columns, unique=False, where=None, if_not_exists=True):
+        if isinstance(columns, str):
+            columns = [columns]
+        quoted_columns = ", ".join(self._quote_identifier(c) for c in columns)
+        condition = "IF NOT EXISTS " if if_not_exists else ""
+        query = f"CREATE {'UNIQUE ' if unique else ''}INDEX {condition}{self._quote_identifier(index_name)} ON {self._quote_identifier(table_name)} ({quoted_columns})"
+        if where:
+            query += f" WHERE {where}"
+        self.execute(query + ";", (), commit=True)
+
+    def index_drop(self, index_name, if_exists=True):
+        condition = "IF EXISTS " if if_exists else ""
+        query = f"DROP INDEX {condition}{self._quote_identifier(index_name)};"
+        self.execute(query, (), commit=True)
+
+    def index_list(self, table_name=None):
         with self.lock:
             self._ensure_open()
-            query = "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;"
+            query = "SELECT name FROM sqlite_master WHERE type='index' AND name NOT LIKE 'sqlite_autoindex_%'"
+            parameters = ()
+            if table_name is not None:
+                query += " AND tbl_name=?"
+                parameters = (table_name,)
+            query += " ORDER BY name;"
             if self.verbose_query_output:
                 print(f"* [NKDBSqlite3] {query}")
-            self.cursor.execute(query)
-            return [row[0] for row in self.cursor.fetchall()]
+            return [row[0] for row in self._run(query, parameters, fetch=True)]
 
-    def table_columns(self, table_name):
+    def index_columns(self, index_name):
         with self.lock:
             self._ensure_open()
-            query = f"PRAGMA table_info({self._quote_identifier(table_name)});"
+            query = f"PRAGMA index_info({self._quote_identifier(index_name)});"
             if self.verbose_query_output:
                 print(f"* [NKDBSqlite3] {query}")
-            self.cursor.execute(query)
-            rows = self.cursor.fetchall()
-            return {
-                row[1]: {
-                    "type": row[2],
-                    "notnull": bool(row[3]),
-                    "default": row[4],
-                    "primary_key": bool(row[5])
-                }
-                for row in rows
-            }
+            return [row[2] for row in self._run(query, fetch=True)]
+
+    def fts_create(self, table_name, columns, fts_name=None, content_rowid="rowid", tokenize=None, rebuild=True):
+        if isinstance(columns, str):
+            columns = [columns]
+        fts_name = fts_name or f"{table_name}_fts"
+        quoted_table = self._quote_identifier(table_name)
+        quoted_fts = self._quote_identifier(fts_name)
+        quoted_rowid = self._quote_identifier(content_rowid)
+        quoted_columns = [self._quote_identifier(c) for c in columns]
+        column_list = ", ".join(quoted_columns)
+        new_values = ", ".join(f"new.{c}" for c in quoted_columns)
+        old_values = ", ".join(f"old.{c}" for c in quoted_columns)
+        options = f", content='{table_name}', content_rowid='{content_rowid}'"
+        if tokenize:
+            options += ", tokenize='" + str(tokenize).replace("'", "''") + "'"
+        insert_new = f"INSERT INTO {quoted_fts}(rowid, {column_list}) VALUES (new.{quoted_rowid}, {new_values});"
+        delete_old = f"INSERT INTO {quoted_fts}({quoted_fts}, rowid, {column_list}) VALUES ('delete', old.{quoted_rowid}, {old_values});"
+        with self.lock:
+            self.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {quoted_fts} USING fts5({column_list}{options});")
+            self.execute(f"CREATE TRIGGER IF NOT EXISTS {self._quote_identifier(fts_name + '_ai')} AFTER INSERT ON {quoted_table} BEGIN {insert_new} END;")
+            self.execute(f"CREATE TRIGGER IF NOT EXISTS {self._quote_identifier(fts_name + '_ad')} AFTER DELETE ON {quoted_table} BEGIN {delete_old} END;")
+            self.execute(f"CREATE TRIGGER IF NOT EXISTS {self._quote_identifier(fts_name + '_au')} AFTER UPDATE ON {quoted_table} BEGIN {delete_old} {insert_new} END;")
+            if rebuild:
+                self.execute(f"INSERT INTO {quoted_fts}({quoted_fts}) VALUES ('rebuild');")
+            self.connection.commit()
+        return fts_name
+
+    def fts_drop(self, table_name, fts_name=None):
+        fts_name = fts_name or f"{table_name}_fts"
+        with self.lock:
+            for suffix in ("_ai", "_ad", "_au"):
+                self.execute(f"DROP TRIGGER IF EXISTS {self._quote_identifier(fts_name + suffix)};")
+            self.execute(f"DROP TABLE IF EXISTS {self._quote_identifier(fts_name)};")
+            self.connection.commit()
+
+    def fts_rebuild(self, table_name, fts_name=None):
+        quoted_fts = self._quote_identifier(fts_name or f"{table_name}_fts")
+        self.execute(f"INSERT INTO {quoted_fts}({quoted_fts}) VALUES ('rebuild');", commit=True)
 
-    def select(self, table_name, columns="*", where=None, params=None, order_by=None, limit=None):
+    def _build_search(self, table_name, fts_name, content_rowid, columns, highlight, markers, fts_columns):
+        quoted_table = self._quote_identifier(table_name)
+        quoted_fts = self._quote_identifier(fts_name)
+        if isinstance(columns, tuple):
+            selected = [f"{quoted_table}.{self._quote_identifier(c)}" for c in columns]
+        else:
+            selected = [f"{quoted_table}.*"]
+        selected.append(f"bm25({quoted_fts}) AS \"rank\"")
+        for column in highlight:
+            if column not in fts_columns:
+                raise ValueError(f"column is not indexed for search: {column}")
+            opening, closing = (m.replace("'", "''") for m in markers)
+            selected.append(
+                f"highlight({quoted_fts}, {fts_columns.index(column)}, '{opening}', '{closing}') AS {self._quote_identifier(column + '_highlight')}"
+            )
+        return (
+            f"SELECT {', '.join(selected)} FROM {quoted_fts} "
+            f"JOIN {quoted_table} ON {quoted_table}.{self._quote_identifier(content_rowid)} = {quoted_fts}.rowid "
+            f"WHERE {quoted_fts} MATCH ? ORDER BY \"rank\" LIMIT ?;"
+        )
+
+    def search(self, table_name, query, limit=20, columns="*", highlight=None, markers=("<b>", "</b>"), fts_name=None, content_rowid="rowid", raw=False):
+        fts_name = fts_name or f"{table_name}_fts"
+        if isinstance(columns, list):
+            columns = tuple(columns)
+        if isinstance(highlight, str):
+            highlight = (highlight,)
+        highlight = tuple(highlight or ())
+        markers = tuple(markers)
+        if not raw:
+            query = " ".join('"' + term.replace('"', '""') + '"' for term in str(query).split())
+        if not query:
+            return []
         with self.lock:
             self._ensure_open()
-            if isinstance(columns, (list, tuple)):
-                column_string = ", ".join(
-                    [self._quote_identifier(c) if identifier_pattern.match(c) else c for c in columns]
-                )
-            else:
-                column_string = columns
-            query = f"SELECT {column_string} FROM {self._quote_identifier(table_name)}"
-            if where:
-                query += f" WHERE {where}"
-            if order_by:
-                query += f" ORDER BY {order_by}"
-            if limit:
-                query += f" LIMIT {int(limit)}"
-            query += ";"
+            fts_columns = list(self.table_columns(fts_name))
+            if not fts_columns:
+                raise ValueError(f"unknown search index: {fts_name}")
+            sql = self._cached_sql(
+                ("search", table_name, fts_name, content_rowid, columns, highlight, markers),
+                self._build_search, table_name, fts_name, content_rowid, columns, highlight, markers, fts_columns
+            )
+            if self.verbose_query_output:
+                print(f"* [NKDBSqlite3] {sql}")
+            rows = self._run(sql, (query, int(limit)), fetch=True)
+        return self._format_rows(rows)
+
+    def _suggest_index_columns(self, query, table_columns):
+        suggested = []
+        where_match = where_clause_pattern.search(query)
+        if where_match:
+            where = where_match.group(1)
+            for pattern in (equality_pattern, range_pattern):
+                for column in pattern.findall(where):
+                    if column in table_columns and column not in suggested:
+                        suggested.append(column)
+        order_match = order_clause_pattern.search(query)
+        if order_match:
+            for column in column_reference_pattern.findall(order_match.group(1)):
+                if column in table_columns and column not in suggested:
+                    suggested.append(column)
+        return suggested
+
+    def index_advice(self, limit=20, min_count=1):
+        with self.lock:
+            hot = sorted(
+                ((key, stats) for key, stats in self._query_stats.items() if stats.count >= min_count),
+                key=lambda item: item[1].total,
+                reverse=True
+            )[:limit]
+            advice = []
+            for query, stats in hot:
+                if query.split(None, 1)[0].upper() not in ("SELECT", "UPDATE", "DELETE", "WITH"):
+                    continue
+                plan = self.explain(query, (None,) * query.count("?"))
+                for step in plan or ():
+                    match = scan_pattern.match(step)
+                    if not match or match.group(1).startswith("sqlite_"):
+                        continue
+                    table_name = match.group(1)
+                    try:
+                        columns = self._suggest_index_columns(query, self.table_columns(table_name))
+                    except (ValueError, sqlite3.Error):
+                        columns = []
+                    suggestion = None
+                    if columns:
+                        index_name = f"idx_{table_name}_{'_'.join(columns)}"
+                        suggestion = f"CREATE INDEX {self._quote_identifier(index_name)} ON {self._quote_identifier(table_name)} ({', '.join(self._quote_identifier(c) for c in columns)});"
+                    advice.append({
+                        "query": query,
+                        "count": stats.count,
+                        "total": stats.total,
+                        "table": table_name,
+                        "plan": plan,
+                        "columns": columns,
+                        "suggestion": suggestion
+                    })
+            return advice
+
+    def select(self, table_name, columns="*", where=None, params=None, order_by=None, limit=None, cache=True):
+        if isinstance(columns, list):
+            columns = tuple(columns)
+        shape = ("select", table_name, columns, where, order_by, limit)
+        cache_key = None
+        if cache and self.result_cache is not None:
+            cache_key = (shape, tuple(sorted(params.items())) if isinstance(params, dict) else tuple(params or ()))
+            rows = self.result_cache.get(cache_key)
+            if rows is not None:
+                return self._format_rows(rows)
+            generation = self.result_cache.generation
+        with self.lock:
+            self._ensure_open()
+            query = self._cached_sql(shape, self._build_select, table_name, columns, where, order_by, limit)
             if self.verbose_query_output:
                 print(f"* [NKDBSqlite3] {query}")
-            self.cursor.execute(query, params or ())
-            rows = self.cursor.fetchall()
-            if self.return_dicts:
-                return [dict(r) for r in rows]
+            rows = self._run(query, params or (), fetch=True)
+        if cache_key is not None:
+            self.result_cache.put(cache_key, rows, referenced_tables(query), generation)
+        return self._format_rows(rows)
+
+    def select_columns(self, table_name, columns="*", where=None, params=None, order_by=None, limit=None, batch_size=1000, use_numpy=True):
+        if isinstance(columns, list):
+            columns = tuple(columns)
+        with self.lock:
+            self._ensure_open()
+            query = self._cached_sql(
+                ("select", table_name, columns, where, order_by, limit),
+                self._build_select, table_name, columns, where, order_by, limit
+            )
+            if self.verbose_query_output:
+                print(f"* [NKDBSqlite3] {query}")
+            cursor = self.connection.cursor()
+            cursor.row_factory = None
+            try:
+                start_time = time.perf_counter()
+                with self._deadline_guard(current_deadline()):
+                    cursor.execute(query, params or ())
+                    names = [description[0] for description in cursor.description]
+                    data = [array.array("q") for _ in names]
+                    row_count = 0
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        row_count += len(rows)
+                        for index, values in enumerate(zip(*rows)):
+                            data[index] = extend_column(data[index], values)
+                self._record_query(query, params or (), time.perf_counter() - start_time, row_count)
+            finally:
+                cursor.close()
+        if use_numpy and numpy is not None:
+            data = [
+                numpy.frombuffer(column, dtype=numpy.int64 if column.typecode == "q" else numpy.float64)
+                if isinstance(column, array.array) else column
+                for column in data
+            ]
+        return NKColumns(names, data)
+
+    def _build_paginate(self, table_name, columns, keys, where, seek, descending, page_size):
+        quoted_keys = [self._quote_identifier(k) for k in keys]
+        if isinstance(columns, tuple):
+            columns = ", ".join(self._quote_identifier(c) if identifier_pattern.match(c) else c for c in columns)
+        columns = f"{columns}, {', '.join(quoted_keys)}"
+        conditions = [f"({where})"] if where else []
+        if seek:
+            key_expression = quoted_keys[0] if len(keys) == 1 else f"({', '.join(quoted_keys)})"
+            placeholders = "?" if len(keys) == 1 else f"({', '.join(['?'] * len(keys))})"
+            conditions.append(f"{key_expression} {'<' if descending else '>'} {placeholders}")
+        direction = "DESC" if descending else "ASC"
+        order_by = ", ".join(f"{k} {direction}" for k in quoted_keys)
+        return self._build_select(table_name, columns, " AND ".join(conditions), order_by, page_size + 1)
+
+    def paginate(self, table_name, order_by, after=None, page_size=50, columns="*", where=None, params=None, descending=False):
+        keys = (order_by,) if isinstance(order_by, str) else tuple(order_by)
+        if isinstance(columns, list):
+            columns = tuple(columns)
+        page_size = max(1, int(page_size))
+        seek_values = ()
+        if after:
+            seek_values = tuple(decode_page_token(after))
+            if len(seek_values) != len(keys):
+                raise ValueError("invalid pagination token")
+        with self.lock:
+            self._ensure_open()
+            query = self._cached_sql(
+                ("paginate", table_name, columns, keys, where, bool(after), descending, page_size),
+                self._build_paginate, table_name, columns, keys, where, bool(after), descending, page_size
+            )
+            if self.verbose_query_output:
+                print(f"* [NKDBSqlite3] {query}")
+            rows = self._run(query, tuple(params or ()) + seek_values, fetch=True)
+            names = [description[0] for description in self.cursor.description][:-len(keys)]
+        token = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            token = encode_page_token(tuple(rows[-1])[-len(keys):])
+        if self.return_dicts:
+            rows = [dict(zip(names, tuple(row)[:-len(keys)])) for row in rows]
+        else:
+            rows = [tuple(row)[:-len(keys)] for row in rows]
+        return {"rows": rows, "next": token}
+
+    def paginate_request(self, request, table_name, order_by, page_size=50, max_page_size=500, token_param="after", **kwargs):
+        try:
+            page_size = min(int(request.query.get("page_size", page_size)), max_page_size)
+        except (ValueError, TypeError):
+            pass
+        after = request.query.get(token_param)
+        if after:
+            try:
+                if len(decode_page_token(after)) != (1 if isinstance(order_by, str) else len(order_by)):
+                    raise ValueError("invalid pagination token")
+            except ValueError:
+                raise NKHTTPError(400, "400 Bad Request: invalid pagination token")
+        page = self.paginate(table_name, order_by, after=after, page_size=page_size, **kwargs)
+        next_link = None
+        if page["next"]:
+            query = dict(request.query)
+            query[token_param] = page["next"]
+            next_link = f"{request.path}?{urllib.parse.urlencode(query, doseq=True)}"
+        return {"rows": page["rows"], "next": next_link}
+
+    def _open_cursor(self, table_name, columns="*", where=None, params=None, order_by=None, limit=None, deadline=None):
+        if isinstance(columns, list):
+            columns = tuple(columns)
+        with self.lock:
+            self._ensure_open()
+            query = self._cached_sql(
+                ("select", table_name, columns, where, order_by, limit),
+                self._build_select, table_name, columns, where, order_by, limit
+            )
+            if self.verbose_query_output:
+                print(f"* [NKDBSqlite3] {query}")
+            cursor = self.connection.cursor()
+            start_time = time.perf_counter()
+            with self._deadline_guard(deadline):
+                cursor.execute(query, params or ())
+            self._record_query(query, params or (), time.perf_counter() - start_time, 0)
+            return cursor, query
+
+    def _fetch_batch(self, cursor, query, batch_size, deadline=None):
+        with self.lock:
+            start_time = time.perf_counter()
+            with self._deadline_guard(deadline):
+                rows = cursor.fetchmany(batch_size)
+            self._record_fetch(query, time.perf_counter() - start_time, len(rows))
             return rows
 
+    def iterate_batches(self, table_name, columns="*", where=None, params=None, order_by=None, limit=None, batch_size=500):
+        deadline = current_deadline()
+        cursor, query = self._open_cursor(table_name, columns, where, params, order_by, limit, deadline)
+
+        def batches():
+            try:
+                while True:
+                    rows = self._fetch_batch(cursor, query, batch_size, deadline)
+                    if not rows:
+                        break
+                    yield self._format_rows(rows)
+            finally:
+                cursor.close()
+
+        return batches()
+
+    def iterate(self, table_name, columns="*", where=None, params=None, order_by=None, limit=None, batch_size=500):
+        batches = self.iterate_batches(table_name, columns, where, params, order_by, limit, batch_size)
+        try:
+            for batch in batches:
+                yield from batch
+        finally:
+            batches.close()
+
+    def json_response(self, table_name, columns="*", where=None, params=None, order_by=None, limit=None, batch_size=500, headers=None, status=200):
+        batches = self.iterate_batches(table_name, columns, where, params, order_by, limit, batch_size)
+        return NKStreamingResponse.json_array(batches, headers=headers, status=status)
+
     def fetchone(self):
         with self.lock:
             self._ensure_open()
+            start_time = time.perf_counter()
             row = self.cursor.fetchone()
+            self._record_fetch(self._pending_query, time.perf_counter() - start_time, row is not None)
             if self.return_dicts and row is not None:
                 return dict(row)
             return row
@@ -136,7 +1134,10 @@ class NKDBSqlite3:
     def fetchall(self):
         with self.lock:
             self._ensure_open()
+            start_time = time.perf_counter()
             rows = self.cursor.fetchall()
+            self._record_fetch(self._pending_query, time.perf_counter() - start_time, len(rows))
+            self._pending_query = None
             if self.return_dicts:
                 return [dict(r) for r in rows]
             return rows
@@ -144,36 +1145,33 @@ class NKDBSqlite3:
     def insert(self, table_name, data, commit=True):
         with self.lock:
             self._ensure_open()
-            keys = list(data.keys())
-            placeholders = ", ".join(["?"] * len(keys))
-            quoted_keys = ", ".join(self._quote_identifier(k) for k in keys)
-            values = tuple(data[k] for k in keys)
-            query = f"INSERT INTO {self._quote_identifier(table_name)} ({quoted_keys}) VALUES ({placeholders});"
+            keys = tuple(data.keys())
+            values = tuple(data.values())
+            if self.check_columns:
+                self.validate_columns(table_name, keys)
+            query = self._cached_sql(("insert", table_name, keys), self._build_insert, table_name, keys)
             self.execute(query, values, commit=commit)
             return self.cursor.lastrowid
 
     def update(self, table_name, updates, where=None, params=None, commit=True):
         with self.lock:
             self._ensure_open()
-            set_clause = ", ".join([f"{self._quote_identifier(k)} = ?" for k in updates.keys()])
+            keys = tuple(updates.keys())
             update_values = tuple(updates.values())
-            query = f"UPDATE {self._quote_identifier(table_name)} SET {set_clause}"
+            if self.check_columns:
+                self.validate_columns(table_name, keys)
+            query = self._cached_sql(("update", table_name, keys, where), self._build_update, table_name, keys, where)
             if where:
-                query += f" WHERE {where}"
-                params = update_values + (params or ())
+                params = update_values + tuple(params or ())
             else:
                 params = update_values
-            query += ";"
             self.execute(query, params, commit=commit)
             return self.cursor.rowcount
 
     def delete(self, table_name, where=None, params=None, commit=True):
         with self.lock:
             self._ensure_open()
-            query = f"DELETE FROM {self._quote_identifier(table_name)}"
-            if where:
-                query += f" WHERE {where}"
-            query += ";"
+            query = self._cached_sql(("delete", table_name, where), self._build_delete, table_name, where)
             self.execute(query, params or (), commit=commit)
             return self.cursor.rowcount
 
@@ -182,7 +1180,7 @@ class NKDBSqlite3:
             self._ensure_open()
             if self.verbose_query_output:
                 print(f"* [NKDBSqlite3] executemany {query} (n={len(sequence_of_parameters)})")
-            self.cursor.executemany(query, sequence_of_parameters)
+            self._run(query, sequence_of_parameters, many=True)
             if commit:
                 self.connection.commit()
             return self.cursor
@@ -192,17 +1190,57 @@ class NKDBSqlite3:
             self._ensure_open()
             if self.verbose_query_output:
                 print(f"* [NKDBSqlite3] {query}")
-            start_time = time.time()
-            result = None
-            try:
-                result = self.cursor.execute(query, parameters) if parameters else self.cursor.execute(query)
-            finally:
-                duration = time.time() - start_time
+            result = self._run(query, parameters)
             if commit:
                 self.connection.commit()
             return result
 
+    def _backup_source(self):
+        if self.database == ":memory:" or str(self.database).startswith("file::memory:"):
+            return None
+        return sqlite3.connect(self.database, timeout=float(self.timeout), check_same_thread=False)
+
+    def backup(self, target, pages_per_step=256, progress=None, sleep=0.0):
+        start_time = time.perf_counter()
+        pages = {"total": 0}
+
+        def on_progress(status, remaining, total):
+            pages["total"] = total
+            if progress is not None:
+                progress(status, remaining, total)
+
+        if isinstance(target, NKDBSqlite3):
+            target_lock = target.lock
+            target._ensure_open()
+            destination, close_destination = target.connection, False
+        elif isinstance(target, sqlite3.Connection):
+            target_lock = threading.RLock()
+            destination, close_destination = target, False
+        else:
+            target_lock = threading.RLock()
+            destination, close_destination = sqlite3.connect(target), True
+        source = self._backup_source()
+        try:
+            with target_lock:
+                if source is not None:
+                    source.backup(destination, pages=pages_per_step, progress=on_progress, sleep=sleep)
+                else:
+                    with self.lock:
+                        self._ensure_open()
+                        self.connection.backup(destination, pages=pages_per_step, progress=on_progress, sleep=sleep)
+        finally:
+            if source is not None:
+                source.close()
+            if close_destination:
+                destination.close()
+        if isinstance(target, NKDBSqlite3):
+            target._schema = None
+            if target.result_cache is not None:
+                target.result_cache.invalidate()
+        return {"pages": pages["total"], "duration": time.perf_counter() - start_time}
+
     def close(self):
+        self.stop_checkpoint_scheduler()
         with self.lock:
             if getattr(self, "cursor", None):
                 try:
@@ -227,3 +1265,165 @@ class NKDBSqlite3:
                 self.connection.commit()
         finally:
             self.close()
+
+class NKDBSqlite3Replica(NKDBSqlite3):
+    def __init__(self, source, refresh_interval=None, pages_per_step=1024, **kwargs):
+        if not isinstance(source, NKDBSqlite3):
+            source = NKDBSqlite3(source, journal_mode=None, synchronous=None, return_dicts=kwargs.get("return_dicts", False))
+        self.source = source
+        self.pages_per_step = pages_per_step
+        self.refresh_count = 0
+        self.last_refresh = None
+        self._refresh_thread = None
+        self._refresh_stop = threading.Event()
+        kwargs.setdefault("return_dicts", source.return_dicts)
+        kwargs.setdefault("journal_mode", None)
+        super().__init__(":memory:", **kwargs)
+        if refresh_interval:
+            self.start_refresh(refresh_interval)
+
+    def _open_connection(self):
+        connection = sqlite3.connect(":memory:", **self.connection_arguments)
+        self.source.backup(connection, pages_per_step=self.pages_per_step)
+        connection.execute("PRAGMA query_only = ON;")
+        self.refresh_count += 1
+        self.last_refresh = time.time()
+        return connection
+
+    def refresh(self):
+        connection = self._open_connection()
+        if self.return_dicts:
+            connection.row_factory = sqlite3.Row
+        for key, value in self.profile_pragmas.items():
+            connection.execute(f"PRAGMA {key} = {value};")
+        with self.lock:
+            old_connection = self.connection
+            self.connection = connection
+            self.cursor = connection.cursor()
+            self._schema = None
+            if self.result_cache is not None:
+                self.result_cache.invalidate()
+        if old_connection is not None:
+            old_connection.close()
+
+    def start_refresh(self, interval):
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return self._refresh_thread
+        self._refresh_stop.clear()
+
+        def run():
+            while not self._refresh_stop.wait(interval):
+                try:
+                    self.refresh()
+                except sqlite3.Error as error:
+                    print(f"* [NKDBSqlite3Replica] refresh failed: {error}")
+
+        self._refresh_thread = threading.Thread(target=run, name="nkdb-replica-refresh", daemon=True)
+        self._refresh_thread.start()
+        return self._refresh_thread
+
+    def stop_refresh(self, timeout=None):
+        self._refresh_stop.set()
+        thread = self._refresh_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        self._refresh_thread = None
+
+    def close(self):
+        self.stop_refresh()
+        super().close()
+
+class NKDBSqlite3Async:
+    def __init__(self, database="./db.sqlite3", workers=4, **kwargs):
+        self.database = database
+        self.workers = max(1, int(workers))
+        if database == ":memory:" or str(database).startswith("file::memory:"):
+            self.workers = 1
+        if kwargs.get("result_cache") is True:
+            kwargs["result_cache"] = NKResultCache()
+        self.result_cache = kwargs.get("result_cache")
+        self.database_arguments = kwargs
+        self.return_dicts = kwargs.get("return_dicts", False)
+        self._executors = [
+            concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"nkdb-aio-{index}")
+            for index in range(self.workers)
+        ]
+        self._databases = [None] * self.workers
+        self._lanes = itertools.count()
+
+    def _lane(self):
+        return next(self._lanes) % self.workers
+
+    def _database(self, lane):
+        if self._databases[lane] is None:
+            self._databases[lane] = NKDBSqlite3(self.database, **self.database_arguments)
+        return self._databases[lane]
+
+    async def _call(self, lane, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executors[lane], function, *args)
+
+    async def _dispatch(self, method, *args, **kwargs):
+        lane = self._lane()
+        call = lambda: getattr(self._database(lane), method)(*args, **kwargs)
+        return await self._call(lane, call)
+
+    async def select(self, *args, **kwargs):
+        return await self._dispatch("select", *args, **kwargs)
+
+    async def insert(self, *args, **kwargs):
+        return await self._dispatch("insert", *args, **kwargs)
+
+    async def update(self, *args, **kwargs):
+        return await self._dispatch("update", *args, **kwargs)
+
+    async def delete(self, *args, **kwargs):
+        return await self._dispatch("delete", *args, **kwargs)
+
+    async def executemany(self, query, sequence_of_parameters, commit=True):
+        lane = self._lane()
+        call = lambda: self._database(lane).executemany(query, sequence_of_parameters, commit=commit).rowcount
+        return await self._call(lane, call)
+
+    async def execute(self, query, parameters=(), commit=False):
+        lane = self._lane()
+
+        def call():
+            database = self._database(lane)
+            with database.lock:
+                database.execute(query, parameters, commit=commit)
+                return database.fetchall()
+
+        return await self._call(lane, call)
+
+    async def iterate(self, table_name, columns="*", where=None, params=None, order_by=None, limit=None, batch_size=500):
+        lane = self._lane()
+        if isinstance(columns, list):
+            columns = tuple(columns)
+
+        deadline = current_deadline()
+        database = await self._call(lane, self._database, lane)
+        cursor, query = await self._call(lane, database._open_cursor, table_name, columns, where, params, order_by, limit, deadline)
+        try:
+            while True:
+                rows = await self._call(lane, database._fetch_batch, cursor, query, batch_size, deadline)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row) if self.return_dicts else row
+        finally:
+            await self._call(lane, cursor.close)
+
+    async def close(self):
+        for lane in range(self.workers):
+            if self._databases[lane] is not None:
+                await self._call(lane, self._databases[lane].close)
+                self._databases[lane] = None
+        for executor in self._executors:
+            executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
@@ -0,0 +1,39 @@
+import time
+import threading
+
+local = threading.local()
+
+def current_deadline():
+    return getattr(local, "deadline", None)
+
+class NKDeadline:
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+        self.cancelled = False
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.cancelled or time.monotonic() >= self.expires_at
+
+    def cancel(self):
+        self.cancelled = True
+
+    def progress_handler(self):
+        return 1 if self.expired() else 0
+
+    def __enter__(self):
+        self.previous = current_deadline()
+        local.deadline = self
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        local.deadline = self.previous
+
+    def __str__(self):
+        return f"<nkapi.NKDeadline - {self.remaining():.3f}s remaining>"
+
+    def __repr__(self):
+        return self.__str__()
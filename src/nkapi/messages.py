@@ -1,4 +1,5 @@
 import json
+import http.client
 import urllib.parse
 
 class NKHeaders(dict):
@@ -25,6 +26,16 @@ class NKHeaders(dict):
         value = super().__getitem__(key.title())
         return value
 
+class NKHTTPError(Exception):
+    def __init__(self, status, body=None, headers=None):
+        super().__init__(status, body)
+        self.status = status
+        self.body = body if body is not None else f"{status} {http.client.responses.get(status, '')}".strip()
+        self.headers = headers
+
+    def response(self):
+        return NKResponse(headers=self.headers, body=self.body, status=self.status)
+
 class NKResponse:
     def __init__(self, headers=None, body=None, status=200):
         self.headers = NKHeaders(headers or {})
@@ -60,12 +71,76 @@ class NKResponse:
     def body(self, value):
         self._body = value
 
+    def iter_body(self):
+        return (self.body,)
+
     def __str__(self):
         return f"<nkapi.NKResponse - \"{self.body[:16]}\" {self.status}>"
     
     def __repr__(self):
         return self.__str__()
 
+class NKStreamingResponse(NKResponse):
+    def __init__(self, headers=None, body=None, status=200):
+        self.headers = NKHeaders(headers or {})
+        self._body = body if body is not None else ()
+        self.status = status
+
+        if "Content-Type" not in self.headers:
+            self.headers["Content-Type"] = "application/octet-stream"
+
+    @property
+    def body(self):
+        if not isinstance(self._body, bytes):
+            self._body = b"".join(self.iter_body())
+        return self._body
+
+    @body.setter
+    def body(self, value):
+        self._body = value
+
+    def iter_body(self):
+        if isinstance(self._body, bytes):
+            yield self._body
+            return
+        chunks = self._body
+        try:
+            for chunk in chunks:
+                if not isinstance(chunk, bytes):
+                    chunk = str(chunk).encode("utf-8", errors="ignore")
+                if chunk:
+                    yield chunk
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+    @classmethod
+    def json_array(cls, batches, headers=None, status=200):
+        def generate():
+            first = True
+            yield b"["
+            try:
+                for batch in batches:
+                    if not batch:
+                        continue
+                    chunk = ", ".join(json.dumps(item) for item in batch)
+                    yield (chunk if first else ", " + chunk).encode("utf-8")
+                    first = False
+            finally:
+                close = getattr(batches, "close", None)
+                if close is not None:
+                    close()
+            yield b"]"
+
+        headers = NKHeaders(headers or {})
+        if "Content-Type" not in headers:
+            headers["Content-Type"] = "application/json"
+        return cls(headers=headers, body=generate(), status=status)
+
+    def __str__(self):
+        return f"<nkapi.NKStreamingResponse - {self.status}>"
+
 class NKRequest:
     def __init__(self, method, path, query=None, headers=None, body=None, client_address=None):
         self.method = method
@@ -73,6 +148,9 @@ class NKRequest:
         query = query or {}
         self.query = {k: v[0] if len(v) == 1 else v for k, v in query.items()}
         self.params = {}
+        self.route = None
+        self.deadline = None
+        self.deferred = []
         self.headers = NKHeaders(headers or {})
         self.body = body
         self.client_address = client_address
@@ -83,6 +161,9 @@ class NKRequest:
             except json.decoder.JSONDecodeError:
                 print("* Warning: Couldn't decode json in the request body.")
                 
+    def defer(self, function, *args, **kwargs):
+        self.deferred.append((function, args, kwargs))
+
     @classmethod
     def from_handler(cls, handler):
         try:
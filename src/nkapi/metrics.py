@@ -0,0 +1,108 @@
+import bisect
+import itertools
+import threading
+
+default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def format_labels(**labels):
+    return "{" + ",".join(f"{key}=\"{escape_label(value)}\"" for key, value in labels.items()) + "}"
+
+class MetricsStripe:
+    def __init__(self, bucket_count):
+        self.lock = threading.Lock()
+        self.bucket_count = bucket_count
+        self.requests = {}
+        self.in_flight = {}
+        self.histograms = {}
+
+    def begin(self, key):
+        with self.lock:
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+
+    def finish(self, key, status, bucket, duration):
+        with self.lock:
+            self.in_flight[key] -= 1
+            request_key = key + (status,)
+            self.requests[request_key] = self.requests.get(request_key, 0) + 1
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (self.bucket_count + 1), 0.0]
+            histogram[0][bucket] += 1
+            histogram[1] += duration
+
+class NKMetrics:
+    def __init__(self, buckets=None, stripes=16, prefix="nkapi"):
+        self.buckets = tuple(sorted(buckets or default_buckets))
+        self.prefix = prefix
+        self.stripes = [MetricsStripe(len(self.buckets)) for _ in range(max(1, stripes))]
+        self.collectors = []
+        self._local = threading.local()
+        self._next_stripe = itertools.count()
+
+    def _stripe(self):
+        stripe = getattr(self._local, "stripe", None)
+        if stripe is None:
+            stripe = self._local.stripe = self.stripes[next(self._next_stripe) % len(self.stripes)]
+        return stripe
+
+    def begin(self, route, method):
+        stripe = self._stripe()
+        stripe.begin((route, method))
+        return stripe
+
+    def finish(self, stripe, route, method, status, duration):
+        bucket = bisect.bisect_left(self.buckets, duration)
+        stripe.finish((route, method), status, bucket, duration)
+
+    def snapshot(self):
+        requests, in_flight, histograms = {}, {}, {}
+        for stripe in self.stripes:
+            with stripe.lock:
+                for key, value in stripe.requests.items():
+                    requests[key] = requests.get(key, 0) + value
+                for key, value in stripe.in_flight.items():
+                    in_flight[key] = in_flight.get(key, 0) + value
+                for key, (counts, total) in stripe.histograms.items():
+                    merged = histograms.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+                    merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                    merged[1] += total
+        return {"requests": requests, "in_flight": in_flight, "histograms": histograms}
+
+    def render(self):
+        snapshot = self.snapshot()
+        prefix = self.prefix
+        lines = [
+            f"# HELP {prefix}_requests_total Total HTTP requests handled.",
+            f"# TYPE {prefix}_requests_total counter"
+        ]
+        for (route, method, status), value in sorted(snapshot["requests"].items()):
+            lines.append(f"{prefix}_requests_total{format_labels(route=route, method=method, status=status)} {value}")
+
+        lines += [
+            f"# HELP {prefix}_requests_in_flight HTTP requests currently being handled.",
+            f"# TYPE {prefix}_requests_in_flight gauge"
+        ]
+        for (route, method), value in sorted(snapshot["in_flight"].items()):
+            lines.append(f"{prefix}_requests_in_flight{format_labels(route=route, method=method)} {value}")
+
+        lines += [
+            f"# HELP {prefix}_request_duration_seconds HTTP request latency.",
+            f"# TYPE {prefix}_request_duration_seconds histogram"
+        ]
+        for (route, method), (counts, total) in sorted(snapshot["histograms"].items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = format_labels(route=route, method=method, le=bound)
+                lines.append(f"{prefix}_request_duration_seconds_bucket{labels} {cumulative}")
+            labels = format_labels(route=route, method=method)
+            lines.append(f"{prefix}_request_duration_seconds_sum{labels} {total}")
+            lines.append(f"{prefix}_request_duration_seconds_count{labels} {cumulative}")
+
+        for collector in self.collectors:
+            lines += collector(prefix)
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,106 @@
+import re
+
+from .messages import NKRequest, NKResponse
+
+def compose(handler, middlewares):
+    for middleware in reversed(middlewares):
+        handler = middleware(handler)
+    return handler
+
+def before_request(function):
+    def middleware(next_handler):
+        def handler(request: NKRequest):
+            response = function(request)
+            if response is not None:
+                return response
+            return next_handler(request)
+        return handler
+    return middleware
+
+def after_request(function):
+    def middleware(next_handler):
+        def handler(request: NKRequest):
+            response = next_handler(request)
+            result = function(request, response)
+            return response if result is None else result
+        return handler
+    return middleware
+
+def compile_origins(origins):
+    exact = set()
+    patterns = []
+    allow_any = False
+    for origin in origins:
+        if origin == "*":
+            allow_any = True
+        elif "*" in origin:
+            patterns.append(re.escape(origin).replace(r"\*", "[^/]*"))
+        else:
+            exact.add(origin)
+    pattern = re.compile("^(?:" + "|".join(patterns) + ")$") if patterns else None
+    return allow_any, frozenset(exact), pattern
+
+def cors_middleware(router, origins, headers, max_age=600, cache_size=1024):
+    allow_any, exact, pattern = compile_origins(origins)
+    default_allow_headers = ", ".join(headers)
+    allowed_cache = {}
+    methods_cache = {}
+
+    def allowed_origin(origin):
+        if not origin:
+            return None
+        if allow_any:
+            return "*"
+        result = allowed_cache.get(origin)
+        if result is None:
+            result = origin if origin in exact or (pattern is not None and pattern.match(origin)) else ""
+            if len(allowed_cache) >= cache_size:
+                allowed_cache.clear()
+            allowed_cache[origin] = result
+        return result or None
+
+    def allow_methods(path):
+        shape = router.route_shape(path)
+        if shape is None:
+            return "OPTIONS"
+        cached = methods_cache.get(shape)
+        if cached is not None and cached[0] == router.version:
+            return cached[1]
+        if shape in router.ambiguous_shapes():
+            return ", ".join(sorted(set(router.allowed_methods(path) + ["OPTIONS"])))
+        value = ", ".join(sorted(router.shapes[shape] | {"OPTIONS"}))
+        if len(methods_cache) >= cache_size:
+            methods_cache.clear()
+        methods_cache[shape] = (router.version, value)
+        return value
+
+    def middleware(next_handler):
+        def handler(request: NKRequest):
+            origin = allowed_origin(request.headers.get("Origin"))
+
+            if request.method.upper() == "OPTIONS":
+                preflight_headers = {
+                    "Content-Type": "text/plain",
+                    "Access-Control-Allow-Methods": allow_methods(request.path) if origin else "OPTIONS",
+                    "Access-Control-Allow-Headers": request.headers.get("Access-Control-Request-Headers") or default_allow_headers,
+                    "Vary": "Origin"
+                }
+                if origin:
+                    preflight_headers["Access-Control-Allow-Origin"] = origin
+                    if max_age:
+                        preflight_headers["Access-Control-Max-Age"] = max_age
+                return NKResponse(status=200, headers=preflight_headers)
+
+            response = next_handler(request)
+            if origin and isinstance(response, NKResponse):
+                response.headers["Access-Control-Allow-Origin"] = origin
+                vary = response.headers.pop("Vary", None)
+                tokens = [token.strip().lower() for token in (vary or "").split(",")]
+                if not vary:
+                    vary = "Origin"
+                elif "origin" not in tokens and "*" not in tokens:
+                    vary = f"{vary}, Origin"
+                response.headers["Vary"] = vary
+            return response
+        return handler
+    return middleware
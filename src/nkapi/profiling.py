@@ -0,0 +1,177 @@
+import io
+import os
+import re
+import sys
+import hmac
+import random
+import pstats
+import cProfile
+import threading
+
+def route_slug(route):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", route).strip("_") or "root"
+
+class NKProfiler:
+    modes = ("cprofile", "sampling")
+
+    def __init__(self, mode="cprofile", routes=None, sample_rate=0.0, header="X-NKAPI-Profile", header_value=None, directory=None, interval=0.005):
+        if mode not in self.modes:
+            raise ValueError(f"unknown profiling mode: {mode}")
+        self.mode = mode
+        self.routes = set(routes or ())
+        self.sample_rate = sample_rate
+        self.header = header
+        self.header_value = header_value
+        self.directory = directory
+        self.interval = interval
+        self.exclude = set()
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.stacks = {}
+        self.requests = {}
+        self.skipped = 0
+        self._cprofile_lock = threading.Lock()
+        self._active = {}
+        self._sampler = None
+        self._sampler_stop = threading.Event()
+
+    def authorized(self, request):
+        if not self.header or self.header_value is None:
+            return False
+        value = request.headers.get(self.header.title())
+        if not value:
+            return False
+        return hmac.compare_digest(str(value).encode("utf-8"), str(self.header_value).encode("utf-8"))
+
+    def should_profile(self, request):
+        route = request.route
+        if route in self.exclude:
+            return False
+        if route in self.routes:
+            return True
+        if self.authorized(request):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def call(self, route, view, request):
+        if self.mode == "cprofile":
+            return self._call_cprofile(route, view, request)
+        return self._call_sampling(route, view, request)
+
+    def _call_cprofile(self, route, view, request):
+        if not self._cprofile_lock.acquire(blocking=False):
+            with self.lock:
+                self.skipped += 1
+            return view(request)
+        try:
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(view, request)
+            finally:
+                stats = pstats.Stats(profile)
+                with self.lock:
+                    self.requests[route] = self.requests.get(route, 0) + 1
+                    if route in self.stats:
+                        self.stats[route].add(stats)
+                    else:
+                        self.stats[route] = stats
+        finally:
+            self._cprofile_lock.release()
+
+    def _call_sampling(self, route, view, request):
+        self._start_sampler()
+        thread_id = threading.get_ident()
+        with self.lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            self._active[thread_id] = (route, sys._getframe())
+        try:
+            return view(request)
+        finally:
+            with self.lock:
+                self._active.pop(thread_id, None)
+
+    def _start_sampler(self):
+        if self._sampler is not None:
+            return
+        with self.lock:
+            if self._sampler is not None:
+                return
+            self._sampler_stop.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, name="nkapi-profiler", daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self):
+        while not self._sampler_stop.wait(self.interval):
+            with self.lock:
+                active = dict(self._active)
+            if not active:
+                continue
+            frames = sys._current_frames()
+            samples = []
+            for thread_id, (route, boundary) in active.items():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None and frame is not boundary:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if stack:
+                    samples.append((route, ";".join(reversed(stack))))
+            with self.lock:
+                for route, stack in samples:
+                    stacks = self.stacks.setdefault(route, {})
+                    stacks[stack] = stacks.get(stack, 0) + 1
+            del frames
+
+    def collapsed(self):
+        with self.lock:
+            return "".join(
+                f"{route};{stack} {count}\n"
+                for route, stacks in sorted(self.stacks.items())
+                for stack, count in sorted(stacks.items())
+            )
+
+    def report(self, sort="cumulative", limit=40):
+        if self.mode == "sampling":
+            return self.collapsed()
+        output = io.StringIO()
+        with self.lock:
+            for route, stats in sorted(self.stats.items()):
+                output.write(f"=== {route} ({self.requests.get(route, 0)} requests) ===\n")
+                stats.stream = output
+                stats.sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+    def dump(self, directory=None):
+        directory = directory or self.directory
+        if not directory:
+            raise ValueError("no profile output directory configured")
+        os.makedirs(directory, exist_ok=True)
+        written = []
+        if self.mode == "sampling":
+            path = os.path.join(directory, "profile.collapsed")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(self.collapsed())
+            written.append(path)
+            return written
+        with self.lock:
+            for route, stats in self.stats.items():
+                path = os.path.join(directory, f"{route_slug(route)}.pstats")
+                stats.dump_stats(path)
+                written.append(path)
+        return written
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+            self.stacks.clear()
+            self.requests.clear()
+            self.skipped = 0
+
+    def close(self):
+        self._sampler_stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        if self.directory:
+            self.dump()
@@ -0,0 +1,126 @@
+import math
+import time
+import threading
+import collections
+
+from .messages import NKRequest, NKResponse
+
+class BucketStripe:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = collections.OrderedDict()
+
+class NKMemoryBucketStore:
+    def __init__(self, stripes=16, max_keys=100000):
+        self.stripes = [BucketStripe() for _ in range(max(1, stripes))]
+        self.max_keys_per_stripe = max(1, max_keys // len(self.stripes))
+        self.evictions = 0
+
+    def take(self, key, rate, capacity, cost=1.0, now=None):
+        now = time.monotonic() if now is None else now
+        stripe = self.stripes[hash(key) % len(self.stripes)]
+        with stripe.lock:
+            bucket = stripe.buckets.get(key)
+            if bucket is None:
+                bucket = stripe.buckets[key] = [float(capacity), now]
+                if len(stripe.buckets) > self.max_keys_per_stripe:
+                    stripe.buckets.popitem(last=False)
+                    self.evictions += 1
+            else:
+                stripe.buckets.move_to_end(key)
+                bucket[0] = min(float(capacity), bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return True, bucket[0]
+            return False, bucket[0]
+
+    def __len__(self):
+        return sum(len(stripe.buckets) for stripe in self.stripes)
+
+class NKSqliteBucketStore:
+    def __init__(self, database, table_name="nkapi_rate_limits"):
+        self.database = database
+        self.table_name = table_name
+        quoted_table = database._quote_identifier(table_name)
+        database.table_create(table_name, {"key": "TEXT PRIMARY KEY", "tokens": "REAL NOT NULL", "updated": "REAL NOT NULL"})
+        refill = "MIN(:capacity, tokens + MAX(0, :now - updated) * :rate)"
+        self.take_query = (
+            f"INSERT INTO {quoted_table} (\"key\", \"tokens\", \"updated\") VALUES (:key, :capacity - :cost, :now) "
+            f"ON CONFLICT(\"key\") DO UPDATE SET \"tokens\" = {refill} - :cost, \"updated\" = :now "
+            f"WHERE {refill} >= :cost RETURNING \"tokens\";"
+        )
+        self.peek_query = f"SELECT {refill} FROM {quoted_table} WHERE \"key\" = :key;"
+
+    def take(self, key, rate, capacity, cost=1.0, now=None):
+        now = time.time() if now is None else now
+        parameters = {"key": str(key), "rate": float(rate), "capacity": float(capacity), "cost": float(cost), "now": now}
+        database = self.database
+        with database.lock:
+            rows = database.execute(self.take_query, parameters).fetchall()
+            if rows:
+                database.connection.commit()
+                return True, rows[0][0]
+            rows = database.execute(self.peek_query, parameters).fetchall()
+            database.connection.commit()
+            return False, rows[0][0] if rows else 0.0
+
+    def prune(self, idle_seconds=3600):
+        return self.database.delete(self.table_name, where="\"updated\" < ?", params=(time.time() - idle_seconds,))
+
+class NKRateLimiter:
+    def __init__(self, rate=10.0, capacity=20, store=None, key_header=None, key=None, limits=None, per_route=True, router=None):
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.store = store or NKMemoryBucketStore()
+        self.key_header = key_header.title() if key_header else None
+        self.key = key
+        self.per_route = per_route
+        self.router = router
+        self.limits = sorted((limits or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self.limited = 0
+
+    def client_key(self, request: NKRequest):
+        if self.key is not None:
+            return self.key(request)
+        if self.key_header:
+            value = request.headers.get(self.key_header)
+            if value:
+                return value
+        address = request.client_address
+        return address[0] if address else "-"
+
+    def route_scope(self, request: NKRequest):
+        if self.router is not None:
+            return self.router.route_for(request.method, request.path) or "<unmatched>"
+        return "/" + request.path.strip("/")
+
+    def resolve(self, request: NKRequest):
+        path = "/" + request.path.strip("/")
+        for prefix, (rate, capacity) in self.limits:
+            if path.startswith(prefix):
+                return prefix, rate, capacity
+        return (self.route_scope(request) if self.per_route else "*"), self.rate, self.capacity
+
+    def __call__(self, next_handler):
+        def handler(request: NKRequest):
+            scope, rate, capacity = self.resolve(request)
+            allowed, remaining = self.store.take(f"{self.client_key(request)}|{scope}", rate, capacity)
+            if not allowed:
+                self.limited += 1
+                retry_after = max(1, math.ceil((1 - remaining) / rate)) if rate > 0 else 60
+                return NKResponse(
+                    status=429,
+                    headers={
+                        "Retry-After": retry_after,
+                        "X-RateLimit-Limit": capacity,
+                        "X-RateLimit-Remaining": 0
+                    },
+                    body="429 Too Many Requests"
+                )
+            response = next_handler(request)
+            if isinstance(response, NKResponse):
+                response.headers["X-RateLimit-Limit"] = capacity
+                response.headers["X-RateLimit-Remaining"] = int(remaining)
+            return response
+        return handler
@@ -1,20 +1,72 @@
+import json
+import time
+import queue
 import traceback
+import threading
+import urllib.parse
+import concurrent.futures
 
-from .messages import NKRequest, NKResponse
+from .messages import NKRequest, NKResponse, NKHTTPError
+from .metrics import NKMetrics
+from .profiling import NKProfiler
+from .deadline import NKDeadline
 
 class RouteNode:
     def __init__(self):
         self.children = {}
         self.handler = None
         self.param_name = None
+        self.route = None
+        self.shape = None
+        self.timeout = None
+
+class ViewThreads:
+    def __init__(self, idle_timeout=30.0):
+        self.idle_timeout = idle_timeout
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def submit(self, function):
+        with self.lock:
+            inbox = self.idle.pop() if self.idle else None
+        if inbox is None:
+            inbox = queue.SimpleQueue()
+            threading.Thread(target=self._work, args=(inbox,), name="nkapi-view", daemon=True).start()
+        inbox.put(function)
+
+    def _work(self, inbox):
+        while True:
+            try:
+                function = inbox.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                with self.lock:
+                    if inbox in self.idle:
+                        self.idle.remove(inbox)
+                        return
+                function = inbox.get()
+            function()
+            with self.lock:
+                self.idle.append(inbox)
 
 class NKRouter:
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, default_timeout=None, max_abandoned_views=64):
         self.routes = {}
         self.debug = debug
+        self.default_timeout = default_timeout
+        self.max_abandoned_views = max_abandoned_views
+        self.abandoned_views = 0
+        self._abandoned_lock = threading.Lock()
+        self._view_threads = ViewThreads()
+        self.metrics = None
+        self.profiler = None
+        self.tasks = None
+        self.version = 0
+        self.shapes = {}
+        self._ambiguous = (None, frozenset())
     
-    def register(self, methods, path, view):
+    def register(self, methods, path, view, timeout=None):
         parts = path.strip("/").split("/")
+        shape = "/" + "/".join("<param>" if p.startswith("<") and p.endswith(">") else p for p in parts)
         for method in methods:
             method = method.upper()
             if method not in self.routes:
@@ -35,33 +87,189 @@ class NKRouter:
                     node = node.children[part]
 
             node.handler = view
+            node.route = "/" + "/".join(parts)
+            node.shape = shape
+            node.timeout = timeout
+            self.shapes.setdefault(shape, set()).add(method)
+        self.version += 1
+
+    def enable_metrics(self, path="/metrics", buckets=None):
+        self.metrics = NKMetrics(buckets=buckets)
+        self.metrics.collectors.append(self._task_metrics)
+
+        def metrics_view(request):
+            return NKResponse(
+                headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+                body=self.metrics.render()
+            )
+
+        if path:
+            self.register(["GET"], path, metrics_view)
+        return self.metrics
+
+    def _task_metrics(self, prefix):
+        return self.tasks.render(prefix) if self.tasks is not None else []
+
+    def enable_profiling(self, profiler=None, path=None, **kwargs):
+        self.profiler = profiler or NKProfiler(**kwargs)
+
+        def profile_view(request):
+            if not self.profiler.authorized(request):
+                return NKResponse(body="403 Forbidden", status=403)
+            if request.query.get("reset"):
+                self.profiler.reset()
+                return NKResponse(body="profile reset")
+            if request.query.get("dump"):
+                if not self.profiler.directory:
+                    return NKResponse(body="400 Bad Request: no profile output directory configured", status=400)
+                return NKResponse(body="\n".join(self.profiler.dump()))
+            return NKResponse(body=self.profiler.report())
+
+        if path:
+            self.register(["GET"], path, profile_view)
+            self.profiler.exclude.add("/" + path.strip("/"))
+        return self.profiler
+
+    def enable_batch(self, path="/batch", max_requests=50, workers=None, inherit_headers=("Authorization", "Cookie"), dispatch=None):
+        batch_path = "/" + path.strip("/")
+        dispatch = dispatch or self.handle
+        executor = None
+        if workers:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nkapi-batch")
+
+        scalar = (str, int, float)
+
+        def invalid(reason):
+            return {"status": 400, "headers": {}, "body": f"400 Bad Request: {reason}"}
+
+        def run(item, parent):
+            if not isinstance(item, dict) or not isinstance(item.get("path"), str):
+                return invalid("expected {method, path, query, body}")
+            if not isinstance(item.get("method", "GET"), str):
+                return invalid("method must be a string")
+            item_query = item.get("query") or {}
+            if not isinstance(item_query, (str, dict)) or isinstance(item_query, dict) and not all(
+                isinstance(v, scalar) or isinstance(v, list) and all(isinstance(x, scalar) for x in v)
+                for v in item_query.values()
+            ):
+                return invalid("query must be a string or an object of strings")
+            item_headers = item.get("headers") or {}
+            if not isinstance(item_headers, dict) or not all(
+                isinstance(k, str) and isinstance(v, scalar) for k, v in item_headers.items()
+            ):
+                return invalid("headers must be an object of strings")
+            parsed = urllib.parse.urlparse(item["path"])
+            if "/" + parsed.path.strip("/") == batch_path:
+                return {"status": 400, "headers": {}, "body": "400 Bad Request: nested batch requests are not allowed"}
+
+            query = urllib.parse.parse_qs(parsed.query)
+            if isinstance(item_query, str):
+                query.update(urllib.parse.parse_qs(item_query))
+            else:
+                query.update({str(k): [str(x) for x in v] if isinstance(v, list) else [str(v)] for k, v in item_query.items()})
+
+            headers = {name: parent.headers[name] for name in inherit_headers if name.title() in parent.headers}
+            headers.update(item_headers)
+            body = item.get("body")
+            if isinstance(body, (dict, list)):
+                headers.setdefault("Content-Type", "application/json")
+
+            request = NKRequest(
+                method=str(item.get("method", "GET")).upper(),
+                path=parsed.path,
+                query=query,
+                headers=headers,
+                body=body,
+                client_address=parent.client_address
+            )
+            response = dispatch(request)
+            parent.deferred.extend(request.deferred)
+            if not isinstance(response, NKResponse):
+                response = NKResponse(body=response)
+
+            body = response.body
+            content_type = response.headers.get("Content-Type", "").lower()
+            if "application/json" in content_type:
+                try:
+                    body = json.loads(body)
+                except ValueError:
+                    body = body.decode("utf-8", errors="replace")
+            else:
+                body = body.decode("utf-8", errors="replace")
+            return {"status": response.status, "headers": dict(response.headers), "body": body}
+
+        def batch_view(request):
+            items = request.body
+            if not isinstance(items, list):
+                return NKResponse(body="400 Bad Request: expected a JSON array of requests", status=400)
+            if len(items) > max_requests:
+                return NKResponse(body=f"413 Payload Too Large: at most {max_requests} requests per batch", status=413)
+            if executor is not None and len(items) > 1:
+                results = list(executor.map(lambda item: run(item, request), items))
+            else:
+                results = [run(item, request) for item in items]
+            return NKResponse(body=results)
+
+        self.register(["POST"], batch_path, batch_view)
+        return batch_view
+
+    def route_for(self, method, path):
+        root = self.routes.get(method.upper())
+        if root is None:
+            return None
+        node, _ = self._match(root, path.strip("/").split("/"), {})
+        return node.route if node else None
+
+    def route_shape(self, path):
+        path_parts = path.strip("/").split("/")
+        for root in self.routes.values():
+            node, _ = self._match(root, path_parts, {})
+            if node:
+                return node.shape
+        return None
+
+    def ambiguous_shapes(self):
+        version, shapes = self._ambiguous
+        if version == self.version:
+            return shapes
+        split = {shape: shape.strip("/").split("/") for shape in self.shapes}
+        ambiguous = set()
+        for shape, parts in split.items():
+            for other, other_parts in split.items():
+                if other != shape and len(parts) == len(other_parts) and all(
+                    a == b or "<param>" in (a, b) for a, b in zip(parts, other_parts)
+                ):
+                    ambiguous.add(shape)
+                    break
+        self._ambiguous = (self.version, frozenset(ambiguous))
+        return self._ambiguous[1]
 
     def allowed_methods(self, path):
         path_parts = path.strip("/").split("/")
         allowed = []
         for method, root in self.routes.items():
-            handler, _ = self._match(root, path_parts, {})
-            if handler:
+            node, _ = self._match(root, path_parts, {})
+            if node:
                 allowed.append(method)
         return allowed
 
     def _match(self, node: RouteNode, parts, params):
         if not parts:
-            return (node.handler, params) if node.handler else (None, {})
+            return (node, params) if node.handler else (None, {})
         
         part = parts[0]
         if part in node.children:
-            handler, p = self._match(node.children[part], parts[1:], params.copy())
-            if handler:
-                return handler, p
+            match, p = self._match(node.children[part], parts[1:], params.copy())
+            if match:
+                return match, p
             
         if "<param>" in node.children:
             child = node.children["<param>"]
             new_params = params.copy()
             new_params[child.param_name] = part
-            handler, p = self._match(child, parts[1:], new_params)
-            if handler:
-                return handler, p
+            match, p = self._match(child, parts[1:], new_params)
+            if match:
+                return match, p
             
         return None, {}
 
@@ -69,19 +277,80 @@ class NKRouter:
         method = request.method.upper()
         path_parts = request.path.strip("/").split("/")
 
+        node, params = None, {}
         if method in self.routes:
-            handler, params = self._match(self.routes[method], path_parts, {})
-            if handler:
-                request.params = params
+            node, params = self._match(self.routes[method], path_parts, {})
+
+        if self.metrics is None:
+            return self._dispatch(request, node, params)
+
+        route = node.route if node else "<unmatched>"
+        stripe = self.metrics.begin(route, method)
+        start_time = time.perf_counter()
+        status = 500
+        try:
+            response = self._dispatch(request, node, params)
+            status = getattr(response, "status", 200)
+            return response
+        finally:
+            self.metrics.finish(stripe, route, method, status, time.perf_counter() - start_time)
+
+    def _call_view(self, node: RouteNode, request: NKRequest):
+        if self.profiler is not None and self.profiler.should_profile(request):
+            return self.profiler.call(node.route, node.handler, request)
+        return node.handler(request)
+
+    def _call_with_deadline(self, node: RouteNode, request: NKRequest, timeout):
+        with self._abandoned_lock:
+            if self.abandoned_views >= self.max_abandoned_views:
+                return NKResponse(headers={"Retry-After": 1}, body="503 Service Unavailable", status=503)
+        deadline = request.deadline = NKDeadline(timeout)
+        done = threading.Event()
+        result = {}
+
+        def run():
+            with deadline:
                 try:
-                    return handler(request)
+                    result["response"] = self._call_view(node, request)
                 except Exception as error:
-                    traceback.print_exception(error)
-                    if self.debug:
-                        tb = "".join(traceback.format_exception(type(error), error, error.__traceback__))
-                        return NKResponse(body=tb, status=500)
-                    else:
-                        return NKResponse(body="500 Internal Server Error", status=500)
+                    result["error"] = error
+                finally:
+                    with self._abandoned_lock:
+                        if result.get("abandoned"):
+                            self.abandoned_views -= 1
+                        done.set()
+
+        self._view_threads.submit(run)
+        if not done.wait(deadline.remaining()):
+            with self._abandoned_lock:
+                if not done.is_set():
+                    result["abandoned"] = True
+                    self.abandoned_views += 1
+            if result.get("abandoned"):
+                deadline.cancel()
+                return NKResponse(body="504 Gateway Timeout", status=504)
+        if "error" in result:
+            raise result["error"]
+        return result["response"]
+
+    def _dispatch(self, request: NKRequest, node, params):
+        if node:
+            request.params = params
+            request.route = node.route
+            try:
+                timeout = node.timeout if node.timeout is not None else self.default_timeout
+                if timeout:
+                    return self._call_with_deadline(node, request, timeout)
+                return self._call_view(node, request)
+            except NKHTTPError as error:
+                return error.response()
+            except Exception as error:
+                traceback.print_exception(error)
+                if self.debug:
+                    tb = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+                    return NKResponse(body=tb, status=500)
+                else:
+                    return NKResponse(body="500 Internal Server Error", status=500)
             
         allowed = self.allowed_methods(request.path)
         if allowed:
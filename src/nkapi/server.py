@@ -1,44 +1,60 @@
-import datetime
+import os
+import sys
+import time
+import stat
+import signal
+import socket
+import socketserver
+import threading
+import traceback
+import subprocess
 import http.server
 import http.client
-import urllib.parse
 
 from . import __version__
 from . import utils
 from .messages import NKRequest, NKResponse
 from .router import NKRouter
+from .accesslog import NKAccessLogger
+from .tasks import NKTaskQueue, DeferredBody
+from .testing import NKTestClient
+from . import middleware
 
 class NKRequestHandler(http.server.BaseHTTPRequestHandler):
     server_version = f"NKAPI/{__version__}"
 
-    def __init__(self, router, debug, cors_origins, cors_headers, *args, **kwargs):
+    def __init__(self, router, debug, cors_origins, cors_headers, *args, access_logger=None, dispatch=None, tasks=None, **kwargs):
         self.router = router
         self.debug = debug
         self.cors_origins = cors_origins
         self.cors_headers = cors_headers
+        self.access_logger = access_logger
+        self.tasks = tasks
+        self.dispatch = dispatch or middleware.compose(
+            router.handle, [middleware.cors_middleware(router, cors_origins, cors_headers)]
+        )
         super().__init__(*args, **kwargs)
 
-    def _cors_origin(self):
-        origin = self.headers.get("Origin")
-        if not origin:
-            return None
-        if "*" in self.cors_origins:
-            return "*"
-        if origin in self.cors_origins:
-            return origin
-        return None
-    
-    def _apply_cors(self, response):
-        origin = self._cors_origin()
-        if not origin:
-            return
-        response.headers["Access-Control-Allow-Origin"] = origin
-        response.headers["Vary"] = "Origin"
+    def parse_request(self):
+        self._start_time = time.perf_counter()
+        return super().parse_request()
 
     def handle_request(self):
         request = NKRequest.from_handler(self)
-        response = self.router.handle(request)
+        response = self.dispatch(request)
         self.respond(response)
+        if request.deferred:
+            self.run_deferred(request.deferred)
+
+    def run_deferred(self, deferred):
+        if self.tasks is not None:
+            self.tasks.schedule(deferred)
+            return
+        for function, args, kwargs in deferred:
+            try:
+                function(*args, **kwargs)
+            except Exception as error:
+                traceback.print_exception(error)
     
     def do_GET(self): self.handle_request()
     def do_POST(self): self.handle_request()
@@ -46,90 +62,238 @@ class NKRequestHandler(http.server.BaseHTTPRequestHandler):
     def do_DELETE(self): self.handle_request()
     def do_PATCH(self): self.handle_request()
     def do_HEAD(self): self.handle_request()
-    def do_OPTIONS(self):
-        origin = self._cors_origin()
-        path = urllib.parse.urlsplit(self.path).path
-        requested_method = self.headers.get("Access-Control-Request-Method")
-        requested_headers = self.headers.get("Access-Control-Request-Headers")
-
-        if origin == "*" or origin in self.cors_origins:
-            allowed_methods = self.router.allowed_methods(path)
-        else:
-            allowed_methods = []
-
-        allow_methods = ", ".join(sorted(set(allowed_methods + ["OPTIONS"])))
-        allow_headers = requested_headers or ", ".join(self.cors_headers)
-
-        response = NKResponse(
-            status=200,
-            headers={
-                "Content-Type": "text/plain",
-                "Access-Control-Allow-Methods": allow_methods,
-                "Access-Control-Allow-Headers": allow_headers,
-                "Vary": "Origin"
-            }
-        )
-
-        self.respond(response)
+    def do_OPTIONS(self): self.handle_request()
 
     def respond(self, response: NKResponse):
-        self._apply_cors(response)
-        self.send_response(response.status)
-        body = response.body
+        self.send_response_only(response.status)
+        self.send_header("Server", self.version_string())
+        self.send_header("Date", self.date_time_string())
+        chunks = response.iter_body()
         for header, value in response.headers.items():
             self.send_header(header, value)
         self.end_headers()
-        self.wfile.write(body)
+        size = 0
+        try:
+            for chunk in chunks:
+                self.wfile.write(chunk)
+                size += len(chunk)
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            self.log_request(response.status, size)
+
+    def log_request(self, code="-", size="-"):
+        if self.access_logger is None:
+            return
+        start_time = getattr(self, "_start_time", None)
+        self.access_logger.log(
+            self.client_address[0],
+            getattr(self, "command", None) or "-",
+            getattr(self, "path", None) or "-",
+            getattr(self, "request_version", None) or "-",
+            getattr(code, "value", code),
+            None if size == "-" else size,
+            None if start_time is None else time.perf_counter() - start_time
+        )
 
-    def log_message(self, format, *args):        
-        timestamp = datetime.datetime.now().strftime("%I:%M:%S %p %m/%d/%Y")
-        
-        method = getattr(self, "command", None) or "-"
-        path = getattr(self, "path", None) or "-"
-        version = getattr(self, "request_version", None) or "-"
-        status = args[1] if len(args) > 1 else "-"
+    def log_message(self, format, *args):
+        if self.access_logger is not None:
+            self.access_logger.message(f"{self.client_address[0]} {format % args}")
 
-        a = utils.ANSI
-        color = {
-            "2": a.WHITE, "3": a.CYAN, "4": a.YELLOW, "5": a.MAGENTA
-        }.get(str(status)[0], "")
+class NKHTTPServer(http.server.ThreadingHTTPServer):
+    def __init__(self, server_address, handler, bind_and_activate=True):
+        self.active = 0
+        self.idle = threading.Condition()
+        self.unix_path = None
+        if isinstance(server_address, (str, bytes, os.PathLike)):
+            self.address_family = socket.AF_UNIX
+            server_address = os.fspath(server_address)
+        super().__init__(server_address, handler, bind_and_activate)
 
-        print(
-            f"{self.client_address[0]} - - [{timestamp}] "
-            f"\"{color}{method} {path} {version}{a.RESET}\" {status} -"
-        )
+    def server_bind(self):
+        if self.address_family != socket.AF_UNIX:
+            return super().server_bind()
+        try:
+            if stat.S_ISSOCK(os.stat(self.server_address).st_mode):
+                os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+        socketserver.TCPServer.server_bind(self)
+        self.unix_path = self.server_address
+        self.server_name, self.server_port = self.server_address, 0
+
+    def get_request(self):
+        request, client_address = super().get_request()
+        if self.address_family == socket.AF_UNIX:
+            client_address = ("unix", 0)
+        return request, client_address
+
+    def server_close(self):
+        super().server_close()
+        if self.unix_path is not None:
+            try:
+                os.unlink(self.unix_path)
+            except OSError:
+                pass
+            self.unix_path = None
+
+    def process_request(self, request, client_address):
+        with self.idle:
+            self.active += 1
+        super().process_request(request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            with self.idle:
+                self.active -= 1
+                self.idle.notify_all()
+
+    def adopt(self, sock):
+        self.socket.close()
+        self.socket = sock
+        sock.listen(self.request_queue_size)
+        self.address_family = sock.family
+        self.server_address = sock.getsockname()
+        if sock.family == socket.AF_UNIX:
+            self.server_name, self.server_port = self.server_address, 0
+        else:
+            host, port = self.server_address[:2]
+            self.server_name = socket.getfqdn(host)
+            self.server_port = port
+
+    def drain(self, timeout=None):
+        with self.idle:
+            return self.idle.wait_for(lambda: self.active == 0, timeout)
 
 class NKServer:
-    def __init__(self, host="127.0.0.1", port=8000, debug=True, cors_origins=None, cors_headers=None):
+    handoff_variable = "NKAPI_LISTEN_FD"
+
+    def __init__(self, host="127.0.0.1", port=8000, debug=True, cors_origins=None, cors_headers=None, cors_max_age=600, access_log=True, wsgi_access_log=False, task_workers=4, task_queue_size=1000, task_drain_timeout=5.0, shutdown_timeout=10.0, unix_socket=None, fd=None):
         self.host = host
         self.port = port if port != 0 else utils.get_free_port(self.host)
         self.debug = bool(debug)
 
         self.cors_origins = cors_origins or ["*"]
         self.cors_headers = cors_headers or ["Content-Type", "Authorization"]
+        self.cors_max_age = cors_max_age
 
+        if access_log is True:
+            access_log = NKAccessLogger()
+        self.access_logger = access_log or None
+        self.wsgi_access_log = wsgi_access_log
+        self.shutdown_timeout = shutdown_timeout
+        self.unix_socket = unix_socket
+        self.fd = fd
+        self.httpd = None
+        self.successor = None
+
+        self.tasks = NKTaskQueue(workers=task_workers, queue_size=task_queue_size, drain_timeout=task_drain_timeout)
         self.router = NKRouter(debug=self.debug)
+        self.router.tasks = self.tasks
+        self.middlewares = []
+        self.build()
         self.handler = lambda *args, **kwargs: NKRequestHandler(
-            self.router, self.debug, self.cors_origins, self.cors_headers, *args, **kwargs
+            self.router, self.debug, self.cors_origins, self.cors_headers, *args,
+            access_logger=self.access_logger, dispatch=self.dispatch, tasks=self.tasks, **kwargs
         )
 
+    def build(self):
+        chain = [middleware.cors_middleware(self.router, self.cors_origins, self.cors_headers, self.cors_max_age)] + self.middlewares
+        self.dispatch = middleware.compose(self.router.handle, chain)
+        return self.dispatch
+
+    def use(self, wrapper):
+        if getattr(wrapper, "router", False) is None:
+            wrapper.router = self.router
+        self.middlewares.append(wrapper)
+        self.build()
+        return wrapper
+
+    def before_request(self, function):
+        self.use(middleware.before_request(function))
+        return function
+
+    def after_request(self, function):
+        self.use(middleware.after_request(function))
+        return function
+
+    def enable_batch(self, **kwargs):
+        return self.router.enable_batch(dispatch=lambda request: self.dispatch(request), **kwargs)
+
+    def test_client(self, **kwargs):
+        return NKTestClient(self, **kwargs)
+
     @property
     def wsgi_app(self):
         def app(environ, start_response):
+            start_time = time.perf_counter()
             request = NKRequest.from_environ(environ)
-            response = self.router.handle(request)
+            response = self.dispatch(request)
 
             status_line = f"{response.status} {http.client.responses.get(response.status, "")}"
+            chunks = response.iter_body()
             headers = [(k, str(v)) for k, v in response.headers.items()]
             start_response(status_line, headers)
 
-            if isinstance(response.body, str):
-                response.body = response.body.encode("utf-8")
-            
-            return [response.body] if environ.get("REQUEST_METHOD", "GET") != "HEAD" else []
+            if environ.get("REQUEST_METHOD", "GET") == "HEAD":
+                close = getattr(chunks, "close", None)
+                if close is not None:
+                    close()
+                chunks = []
+            if request.deferred:
+                chunks = DeferredBody(chunks, environ.get("nkapi.tasks", self.tasks), request.deferred)
+            if self.wsgi_access_log and self.access_logger is not None:
+                return self._logged_chunks(environ, response.status, chunks, start_time)
+            return chunks
         return app
 
+    def _logged_chunks(self, environ, status, chunks, start_time):
+        size = 0
+        try:
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            query = environ.get("QUERY_STRING")
+            self.access_logger.log(
+                environ.get("REMOTE_ADDR", "-"),
+                environ.get("REQUEST_METHOD", "-"),
+                environ.get("PATH_INFO", "/") + (f"?{query}" if query else ""),
+                environ.get("SERVER_PROTOCOL", "-"),
+                status,
+                size,
+                time.perf_counter() - start_time
+            )
+
+    def listen(self):
+        fd = os.environ.pop(self.handoff_variable, None)
+        if fd is None:
+            fd = self.fd if self.fd is not None else utils.systemd_listen_fd()
+        if fd is None:
+            return NKHTTPServer(self.unix_socket or (self.host, self.port), self.handler)
+        httpd = NKHTTPServer((self.host, self.port), self.handler, bind_and_activate=False)
+        httpd.adopt(socket.socket(fileno=int(fd)))
+        if httpd.address_family == socket.AF_UNIX:
+            self.unix_socket = httpd.server_address
+        else:
+            self.host, self.port = httpd.server_address[:2]
+        return httpd
+
+    @property
+    def url(self):
+        if self.unix_socket:
+            return f"http+unix://{self.unix_socket}"
+        return f"http://{self.host}:{self.port}/"
+
     def start(self):
+        self.httpd = self.listen()
+
         print(
             "* Serving NKAPI app",
             f"* Debug mode: {['off', 'on'][int(self.debug)]}",
@@ -140,19 +304,44 @@ class NKServer:
             print(f"{utils.ANSI.RED}* WARNING: This is a development server. Do not use it in a production deployment. Use a production WSGI server instead.{utils.ANSI.RESET}")
 
         print(
-            f"* Running on http://{self.host}:{self.port}/",
+            f"* Running on {self.url}",
             f"{utils.ANSI.YELLOW}* Press CTRL+C to quit{utils.ANSI.RESET}",
             sep="\n"
         )
 
-        self.httpd = http.server.ThreadingHTTPServer(
-            (self.host, self.port),
-            self.handler
-        )
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+            if hasattr(signal, "SIGHUP"):
+                signal.signal(signal.SIGHUP, lambda signum, frame: self.reload())
 
         try:
             self.httpd.serve_forever()
         except KeyboardInterrupt:
-            print("\n* Closing the server...")
-            self.httpd.server_close()
-            exit(0)
+            pass
+        finally:
+            self.close()
+
+    def stop(self):
+        if self.httpd is not None:
+            threading.Thread(target=self.httpd.shutdown, name="nkapi-shutdown", daemon=True).start()
+
+    def reload(self):
+        listener = self.httpd.socket
+        listener.set_inheritable(True)
+        environment = dict(os.environ, **{self.handoff_variable: str(listener.fileno())})
+        self.successor = subprocess.Popen(
+            [sys.executable] + sys.orig_argv[1:], env=environment, pass_fds=(listener.fileno(),)
+        )
+        self.httpd.unix_path = None
+        print(f"* Handed the listening socket to pid {self.successor.pid}")
+        self.stop()
+        return self.successor
+
+    def close(self):
+        print("\n* Closing the server...")
+        self.httpd.server_close()
+        if not self.httpd.drain(self.shutdown_timeout):
+            print(f"* {self.httpd.active} requests still running after {self.shutdown_timeout}s")
+        self.tasks.close()
+        if self.access_logger is not None:
+            self.access_logger.close()
@@ -0,0 +1,127 @@
+import time
+import queue
+import atexit
+import threading
+import traceback
+
+from .metrics import format_labels
+
+class NKTaskQueue:
+    def __init__(self, workers=4, queue_size=1000, drain_timeout=5.0):
+        self.workers = max(1, workers)
+        self.drain_timeout = drain_timeout
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.closed = False
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, function, *args, **kwargs):
+        if self.closed:
+            self.dropped += 1
+            return False
+        if len(self._threads) < self.workers:
+            self.start()
+        try:
+            self.queue.put_nowait((function, args, kwargs))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def schedule(self, deferred):
+        for function, args, kwargs in deferred:
+            self.submit(function, *args, **kwargs)
+
+    def start(self):
+        with self._lock:
+            if not self._threads:
+                atexit.register(self.close)
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f"nkapi-task-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                self.queue.task_done()
+                return
+            function, args, kwargs = task
+            with self._lock:
+                self.running += 1
+            try:
+                function(*args, **kwargs)
+                failed = False
+            except Exception as error:
+                traceback.print_exception(error)
+                failed = True
+            with self._lock:
+                self.running -= 1
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+            self.queue.task_done()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": len(self._threads),
+                "queued": self.queue.qsize(),
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "dropped": self.dropped
+            }
+
+    def render(self, prefix="nkapi"):
+        stats = self.stats()
+        lines = [
+            f"# HELP {prefix}_tasks_queued Deferred tasks waiting for a worker.",
+            f"# TYPE {prefix}_tasks_queued gauge",
+            f"{prefix}_tasks_queued {stats['queued']}",
+            f"# HELP {prefix}_tasks_running Deferred tasks currently running.",
+            f"# TYPE {prefix}_tasks_running gauge",
+            f"{prefix}_tasks_running {stats['running']}",
+            f"# HELP {prefix}_tasks_total Deferred tasks by outcome.",
+            f"# TYPE {prefix}_tasks_total counter"
+        ]
+        for result in ("completed", "failed", "dropped"):
+            lines.append(f"{prefix}_tasks_total{format_labels(result=result)} {stats[result]}")
+        return lines
+
+    def close(self, timeout=None):
+        timeout = self.drain_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        self.closed = True
+        threads = [thread for thread in self._threads if thread.is_alive()]
+        for _ in threads:
+            try:
+                self.queue.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in threads)
+
+class DeferredBody:
+    def __init__(self, chunks, tasks, deferred):
+        self.chunks = chunks
+        self.tasks = tasks
+        self.deferred = deferred
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        close = getattr(self.chunks, "close", None)
+        if close is not None:
+            close()
+        deferred, self.deferred = self.deferred, None
+        if deferred:
+            self.tasks.schedule(deferred)
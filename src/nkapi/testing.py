@@ -0,0 +1,138 @@
+import io
+import json
+import traceback
+import urllib.parse
+
+from .messages import NKHeaders, NKRequest, NKResponse
+
+class NKTestResponse:
+    def __init__(self, status, headers, data):
+        self.status = status
+        self.headers = headers
+        self.data = data
+
+    @property
+    def text(self):
+        return self.data.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.data)
+
+    def __str__(self):
+        return f"<nkapi.NKTestResponse - \"{self.data[:16]}\" {self.status}>"
+
+    def __repr__(self):
+        return self.__str__()
+
+class InlineTasks:
+    def schedule(self, deferred):
+        for function, args, kwargs in deferred:
+            try:
+                function(*args, **kwargs)
+            except Exception as error:
+                traceback.print_exception(error)
+
+inline_tasks = InlineTasks()
+
+class NKTestClient:
+    def __init__(self, server, wsgi=False, headers=None, client_address=("127.0.0.1", 0)):
+        self.server = server
+        self.wsgi = wsgi
+        self.headers = dict(headers or {})
+        self.client_address = client_address
+
+    def request(self, method, path, query=None, headers=None, body=None, json_body=None):
+        method = method.upper()
+        parsed = urllib.parse.urlparse(path)
+        query_string = parsed.query
+        if query:
+            extra = urllib.parse.urlencode(query, doseq=True) if not isinstance(query, str) else query
+            query_string = f"{query_string}&{extra}" if query_string else extra
+
+        headers = {**self.headers, **(headers or {})}
+        if json_body is not None:
+            body = json.dumps(json_body)
+            headers.setdefault("Content-Type", "application/json")
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        if self.wsgi:
+            return self._wsgi_request(method, parsed.path or "/", query_string, headers, body or b"")
+        return self._dispatch_request(method, parsed.path or "/", query_string, headers, body)
+
+    def _dispatch_request(self, method, path, query_string, headers, body):
+        request = NKRequest(
+            method=method,
+            path=path,
+            query=urllib.parse.parse_qs(query_string),
+            headers=headers,
+            body=body.decode("utf-8", errors="ignore") if body else None,
+            client_address=self.client_address
+        )
+        response = self.server.dispatch(request)
+        if not isinstance(response, NKResponse):
+            response = NKResponse(body=response)
+
+        chunks = response.iter_body()
+        try:
+            data = b"" if method == "HEAD" else b"".join(chunks)
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+        if request.deferred:
+            inline_tasks.schedule(request.deferred)
+        return NKTestResponse(response.status, NKHeaders(response.headers), data)
+
+    def _wsgi_request(self, method, path, query_string, headers, body):
+        environ = {
+            "REQUEST_METHOD": method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": path,
+            "QUERY_STRING": query_string,
+            "SERVER_NAME": "localhost",
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "REMOTE_ADDR": self.client_address[0],
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": io.StringIO(),
+            "wsgi.multithread": False,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+            "nkapi.tasks": inline_tasks
+        }
+        for key, value in headers.items():
+            name = key.upper().replace("-", "_")
+            if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                environ[name] = str(value)
+            else:
+                environ["HTTP_" + name] = str(value)
+
+        captured = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            captured["status"] = int(status.split(" ", 1)[0])
+            captured["headers"] = response_headers
+
+        result = self.server.wsgi_app(environ, start_response)
+        try:
+            data = b"".join(result)
+        finally:
+            close = getattr(result, "close", None)
+            if close is not None:
+                close()
+        headers = NKHeaders()
+        for key, value in captured["headers"]:
+            headers[key] = value
+        return NKTestResponse(captured["status"], headers, data)
+
+    def get(self, path, **kwargs): return self.request("GET", path, **kwargs)
+    def post(self, path, **kwargs): return self.request("POST", path, **kwargs)
+    def put(self, path, **kwargs): return self.request("PUT", path, **kwargs)
+    def patch(self, path, **kwargs): return self.request("PATCH", path, **kwargs)
+    def delete(self, path, **kwargs): return self.request("DELETE", path, **kwargs)
+    def head(self, path, **kwargs): return self.request("HEAD", path, **kwargs)
+    def options(self, path, **kwargs): return self.request("OPTIONS", path, **kwargs)
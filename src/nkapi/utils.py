@@ -41,6 +41,17 @@ def get_free_port(host=""):
     sock.close()
     return port
 
+def systemd_listen_fd():
+    if os.environ.get("LISTEN_PID") != str(os.getpid()):
+        return None
+    try:
+        count = int(os.environ.get("LISTEN_FDS", "0"))
+    except ValueError:
+        return None
+    for name in ("LISTEN_PID", "LISTEN_FDS", "LISTEN_FDNAMES"):
+        os.environ.pop(name, None)
+    return 3 if count > 0 else None
+
 if ansi_check():
     ANSI.ESC = "\x1b["
     ANSI.RESET = ANSI.ESC + "0m"
@@ -0,0 +1,511 @@
+import json
+import time
+import asyncio
+import sqlite3
+import nkapi
+
+def make_db(**kwargs):
+    db = nkapi.NKDBSqlite3(database=":memory:", **kwargs)
+    db.table_create("items", {"id": "INTEGER PRIMARY KEY", "name": "TEXT", "price": "REAL"})
+    return db
+
+def test_query_stats_aggregate_by_normalized_statement():
+    db = make_db()
+    db.insert("items", {"name": "a", "price": 1.0})
+    db.insert("items", {"name": "b", "price": 2.0})
+    db.execute("SELECT * FROM items WHERE id = 1")
+    db.execute("SELECT * FROM items WHERE id = 2")
+    db.select("items", where="price > ?", params=(0,))
+
+    stats = db.query_stats()
+    assert stats["SELECT * FROM items WHERE id = ?"]["count"] == 2
+    insert = stats['INSERT INTO "items" ("name", "price") VALUES (?, ?)']
+    assert insert["count"] == 2
+    assert insert["rows"] == 2
+    select = stats['SELECT * FROM "items" WHERE price > ?']
+    assert select["rows"] == 2
+    assert 0 <= select["p50"] <= select["p95"] <= select["max"]
+
+def test_query_stats_count_rows_when_the_caller_fetches():
+    db = make_db()
+    for index in range(5):
+        db.insert("items", {"name": f"n{index}", "price": float(index)})
+
+    db.execute("SELECT * FROM items WHERE price >= 2")
+    assert len(db.fetchall()) == 3
+    db.execute("SELECT * FROM items WHERE price >= 4")
+    assert db.fetchone() is not None
+    assert db.fetchone() is None
+    assert db.query_stats()["SELECT * FROM items WHERE price >= ?"]["rows"] == 4
+
+    assert len(list(db.iterate("items", batch_size=2))) == 5
+    assert db.query_stats()['SELECT * FROM "items"']["rows"] == 5
+
+def test_slow_query_log_records_query_plan():
+    db = make_db(slow_query_threshold=0)
+    db.select("items", where="name = ?", params=("a",))
+
+    entry = db.slow_query_log[-1]
+    assert entry["query"].startswith('SELECT * FROM "items"')
+    assert entry["parameters"] == ("a",)
+    assert any("SCAN" in step for step in entry["plan"])
+
+def test_reset_query_stats_clears_everything():
+    db = make_db(slow_query_threshold=0)
+    db.table_list()
+    db.reset_query_stats()
+    assert db.query_stats() == {}
+    assert len(db.slow_query_log) == 0
+
+def test_statement_cache_reuses_generated_sql():
+    db = make_db()
+    db.clear_statement_cache()
+    for index in range(5):
+        db.insert("items", {"name": f"n{index}", "price": index})
+        db.select("items", columns=["id", "name"], where="id = ?", params=(index,))
+    db.update("items", {"price": 9}, where="id = ?", params=(1,))
+    db.delete("items", where="id = ?", params=(2,))
+
+    stats = db.statement_cache_stats()
+    assert stats["misses"] == 4
+    assert stats["hits"] == 8
+    assert stats["size"] == 4
+    assert db.select("items", where="id = ?", params=(1,))[0][2] == 9
+    assert db.select("items", where="id = ?", params=(2,)) == []
+
+def test_statement_cache_is_bounded():
+    db = make_db(statement_cache_size=2)
+    for column in ["id", "name", "price"]:
+        db.select("items", columns=[column])
+    assert db.statement_cache_stats()["size"] == 2
+    assert db.connection_arguments["cached_statements"] == 2
+
+def test_result_cache_serves_repeated_selects():
+    db = make_db(result_cache=True)
+    db.insert("items", {"name": "a", "price": 1.0})
+
+    first = db.select("items", where="name = ?", params=("a",))
+    second = db.select("items", where="name = ?", params=("a",))
+    assert first == second
+    assert db.result_cache.stats()["hits"] == 1
+
+def test_result_cache_invalidated_by_writes_to_the_table():
+    db = make_db(result_cache=True, return_dicts=True)
+    db.insert("items", {"name": "a", "price": 1.0})
+    assert db.select("items")[0]["price"] == 1.0
+
+    db.update("items", {"price": 2.0}, where="name = ?", params=("a",))
+    assert db.select("items")[0]["price"] == 2.0
+
+    db.execute('DELETE FROM "items";', commit=True)
+    assert db.select("items") == []
+
+def test_result_cache_invalidated_by_cascades_and_triggers():
+    db = make_db(result_cache=True)
+    db.table_create("p", {"id": "INTEGER PRIMARY KEY"})
+    db.table_create("c", {"id": "INTEGER PRIMARY KEY", "pid": "INTEGER REFERENCES p(id) ON DELETE CASCADE"})
+    db.execute("CREATE TRIGGER log_items AFTER INSERT ON c BEGIN INSERT INTO items (name) VALUES ('child'); END;", commit=True)
+    db.insert("p", {"id": 1})
+    db.insert("p", {"id": 2})
+    assert db.select("items") == []
+
+    db.insert("c", {"id": 1, "pid": 1})
+    db.insert("c", {"id": 2, "pid": 2})
+    assert [row[1] for row in db.select("items")] == ["child", "child"]
+    assert len(db.select("c")) == 2
+
+    db.delete("p", where="id = ?", params=(1,))
+    assert db.select("c") == [(2, 2)]
+    db.delete("p", where="id = ?", params=(2,))
+    assert db.select("c") == []
+    assert db.select("c", cache=False) == []
+
+def test_result_cache_stays_correct_when_the_write_memo_is_evicted():
+    db = make_db(result_cache=True)
+    db.table_create("p", {"id": "INTEGER PRIMARY KEY"})
+    db.table_create("c", {"id": "INTEGER PRIMARY KEY", "pid": "INTEGER REFERENCES p(id) ON DELETE CASCADE"})
+    for index in range(3):
+        db.insert("p", {"id": index})
+        db.insert("c", {"id": index, "pid": index})
+
+    db.delete("p", where="id = ?", params=(0,))
+    db._write_targets.clear()
+    assert len(db.select("c")) == 2
+    db.delete("p", where="id = ?", params=(1,))
+    assert db.select("c") == [(2, 2)]
+    assert db.select("c") == db.select("c", cache=False)
+
+def test_result_cache_keeps_other_tables_and_respects_bounds():
+    cache = nkapi.NKResultCache(max_entries=2, ttl=None)
+    db = make_db(result_cache=cache)
+    db.table_create("tags", {"id": "INTEGER PRIMARY KEY", "label": "TEXT"})
+    db.select("tags")
+    db.insert("items", {"name": "a", "price": 1.0})
+    db.select("tags")
+    assert cache.stats()["hits"] == 1
+
+    db.select("items", columns=["id"])
+    db.select("items", columns=["name"])
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["evictions"] == 1
+
+def test_async_facade_round_trip(tmp_path):
+    path = str(tmp_path / "aio.sqlite3")
+    database = nkapi.NKDBSqlite3(database=path)
+    database.table_create("items", {"id": "INTEGER PRIMARY KEY", "name": "TEXT"})
+    database.close()
+
+    async def scenario():
+        async with nkapi.NKDBSqlite3Async(path, workers=2, return_dicts=True) as db:
+            for index in range(10):
+                await db.insert("items", {"name": f"n{index}"})
+            assert await db.update("items", {"name": "first"}, where="id = ?", params=(1,)) == 1
+            assert await db.delete("items", where="id > ?", params=(8,)) == 2
+            rows = await db.select("items", columns=["id", "name"], order_by="id")
+            streamed = [row async for row in db.iterate("items", order_by="id", batch_size=3)]
+            count = await db.execute('SELECT COUNT(*) AS total FROM "items";')
+            return rows, streamed, count
+
+    rows, streamed, count = asyncio.run(scenario())
+    assert rows[0] == {"id": 1, "name": "first"}
+    assert streamed == rows
+    assert count == [{"total": 8}]
+
+def test_select_columns_builds_typed_arrays():
+    db = make_db()
+    db.executemany('INSERT INTO "items" ("name", "price") VALUES (?, ?);', [("a", 1), ("b", 2.5), ("c", 4)])
+
+    result = db.select_columns("items", order_by="id", batch_size=2, use_numpy=False)
+    assert len(result) == 3
+    assert result.names == ["id", "name", "price"]
+    assert result["id"].typecode == "q"
+    assert result["price"].typecode == "d"
+    assert list(result["price"]) == [1.0, 2.5, 4.0]
+    assert result["name"] == ["a", "b", "c"]
+
+def test_select_columns_row_view_and_null_fallback():
+    db = make_db()
+    db.insert("items", {"name": "a", "price": None})
+    db.insert("items", {"name": "b", "price": 3})
+
+    result = db.select_columns("items", columns=["name", "price"], use_numpy=False)
+    assert result["price"] == [None, 3]
+    row = result[1]
+    assert row == ("b", 3)
+    assert row["name"] == "b"
+    assert row.as_dict() == {"name": "b", "price": 3}
+    assert [r["name"] for r in result] == ["a", "b"]
+    assert result.to_dict() == {"name": ["a", "b"], "price": [None, 3]}
+
+def test_paginate_walks_all_rows_with_continuation_tokens():
+    db = make_db()
+    db.executemany('INSERT INTO "items" ("name", "price") VALUES (?, ?);', [(f"n{i}", i % 3) for i in range(7)])
+
+    seen, token = [], None
+    while True:
+        page = db.paginate("items", order_by="id", after=token, page_size=3, columns=["name"])
+        seen.extend(row[0] for row in page["rows"])
+        token = page["next"]
+        if token is None:
+            break
+    assert seen == [f"n{i}" for i in range(7)]
+
+def test_paginate_composite_keys_descending_and_where():
+    db = make_db()
+    db.executemany('INSERT INTO "items" ("name", "price") VALUES (?, ?);', [(f"n{i}", i % 2) for i in range(6)])
+
+    first = db.paginate("items", order_by=["price", "id"], page_size=3, descending=True, where="id > ?", params=(1,))
+    second = db.paginate("items", order_by=["price", "id"], after=first["next"], page_size=3, descending=True, where="id > ?", params=(1,))
+    assert [row[0] for row in first["rows"] + second["rows"]] == [6, 4, 2, 5, 3]
+    assert second["next"] is None
+
+def test_paginate_request_builds_next_link():
+    db = make_db(return_dicts=True)
+    for index in range(3):
+        db.insert("items", {"name": f"n{index}", "price": index})
+
+    request = nkapi.NKRequest("GET", "/items", query={"page_size": ["2"], "q": ["x"]})
+    page = db.paginate_request(request, "items", "id")
+    assert [row["id"] for row in page["rows"]] == [1, 2]
+    assert page["next"].startswith("/items?page_size=2&q=x&after=")
+
+    token = page["next"].split("after=")[1]
+    request = nkapi.NKRequest("GET", "/items", query={"after": [token]})
+    page = db.paginate_request(request, "items", "id")
+    assert [row["id"] for row in page["rows"]] == [3]
+    assert page["next"] is None
+
+def test_paginate_strips_key_columns_the_caller_did_not_ask_for():
+    db = make_db()
+    db.executemany('INSERT INTO "items" ("name", "price") VALUES (?, ?);', [(f"n{i}", i) for i in range(5)])
+
+    first = db.paginate("items", order_by="id", page_size=2, columns="name")
+    assert first["rows"] == [("n0",), ("n1",)]
+    second = db.paginate("items", order_by="id", after=first["next"], page_size=2, columns=["name", "price"])
+    assert second["rows"] == [("n2", 2.0), ("n3", 3.0)]
+
+    db = make_db(return_dicts=True)
+    db.insert("items", {"name": "a", "price": 1.0})
+    assert db.paginate("items", order_by="id", columns=["name"])["rows"] == [{"name": "a"}]
+
+def test_paginate_request_rejects_invalid_tokens_with_400():
+    db = make_db()
+    router = nkapi.NKRouter()
+    router.register(["GET"], "/items", lambda request: nkapi.NKResponse(body=db.paginate_request(request, "items", "id")))
+
+    assert router.handle(nkapi.NKRequest("GET", "/items", query={"after": ["not-a-token"]})).status == 400
+    assert router.handle(nkapi.NKRequest("GET", "/items", query={"after": ["WzEsMl0"]})).status == 400
+    assert router.handle(nkapi.NKRequest("GET", "/items", query={"after": [nkapi.database.encode_page_token([{"a": 1}])]})).status == 400
+    assert router.handle(nkapi.NKRequest("GET", "/items")).status == 200
+
+def test_index_create_list_and_drop():
+    db = make_db()
+    db.index_create("idx_items_name", "items", ["name", "price"])
+    db.index_create("idx_items_price", "items", "price", unique=True, where="price > 0")
+
+    assert db.index_list() == ["idx_items_name", "idx_items_price"]
+    assert db.index_list("missing") == []
+    assert db.index_columns("idx_items_name") == ["name", "price"]
+
+    db.index_drop("idx_items_name")
+    db.index_drop("idx_items_name")
+    assert db.index_list("items") == ["idx_items_price"]
+
+def test_index_advice_flags_full_scans_and_suggests_index():
+    db = make_db()
+    db.select("items", where="name = ? AND price > ?", params=("a", 1))
+    db.select("items", where="id = ?", params=(1,))
+
+    advice = db.index_advice()
+    assert len(advice) == 1
+    assert advice[0]["table"] == "items"
+    assert advice[0]["columns"] == ["name", "price"]
+    db.execute(advice[0]["suggestion"], commit=True)
+
+    db.reset_query_stats()
+    db.select("items", where="name = ? AND price > ?", params=("a", 1))
+    assert db.index_advice() == []
+
+def test_pragma_profile_applies_all_settings(tmp_path):
+    db = nkapi.NKDBSqlite3(database=str(tmp_path / "profile.sqlite3"), profile="read_heavy")
+    values = db.pragma_values(["cache_size", "mmap_size", "temp_store", "busy_timeout", "wal_autocheckpoint"])
+    assert db.profile == "read_heavy"
+    assert values == {"cache_size": -65536, "mmap_size": 268435456, "temp_store": 2, "busy_timeout": 5000, "wal_autocheckpoint": 1000}
+
+    db.close()
+    assert db.pragma_values(["busy_timeout"]) == {"busy_timeout": 5000}
+
+def test_profile_page_size_applies_to_new_and_existing_wal_databases(tmp_path):
+    db = nkapi.NKDBSqlite3(database=str(tmp_path / "bulk.sqlite3"), profile="bulk_load")
+    db.table_create("items", {"id": "INTEGER PRIMARY KEY", "name": "TEXT"})
+    assert db.pragma_values(["page_size", "journal_mode"]) == {"page_size": 65536, "journal_mode": "wal"}
+    db.close()
+
+    db = nkapi.NKDBSqlite3(database=str(tmp_path / "existing.sqlite3"))
+    db.table_create("items", {"id": "INTEGER PRIMARY KEY", "name": "TEXT"})
+    db.insert("items", {"name": "a"})
+    db.apply_profile("bulk_load")
+    assert db.pragma_values(["page_size"]) == {"page_size": 4096}
+    db.apply_profile("bulk_load", vacuum=True)
+    assert db.pragma_values(["page_size", "journal_mode"]) == {"page_size": 65536, "journal_mode": "wal"}
+    assert db.select("items") == [(1, "a")]
+
+def test_unknown_pragma_profile_raises():
+    try:
+        nkapi.NKDBSqlite3(database=":memory:", profile="nope")
+    except ValueError:
+        return
+    assert False
+
+def test_wal_checkpoint_manual_and_scheduled(tmp_path):
+    db = nkapi.NKDBSqlite3(database=str(tmp_path / "wal.sqlite3"), profile={"wal_autocheckpoint": 0})
+    db.table_create("items", {"id": "INTEGER PRIMARY KEY", "name": "TEXT"})
+    db.executemany('INSERT INTO "items" ("name") VALUES (?);', [(str(i),) for i in range(100)])
+
+    result = db.checkpoint("truncate")
+    assert result["mode"] == "TRUNCATE"
+    assert result["log_pages"] == 0
+
+    db.insert("items", {"name": "x"})
+    db.start_checkpoint_scheduler(interval=0.01)
+    time.sleep(0.1)
+    db.close()
+    assert db.checkpoint_stats["modes"]["PASSIVE"] >= 1
+    assert db._checkpoint_thread is None
+
+def test_schema_cache_avoids_repeated_metadata_queries():
+    db = make_db()
+    db.table_columns("items")
+    db.reset_query_stats()
+    for _ in range(5):
+        assert db.table_exists("items")
+        assert "price" in db.table_columns("items")
+        assert db.table_list() == ["items"]
+    assert db.query_stats() == {}
+
+def test_schema_cache_invalidated_by_ddl_and_external_changes(tmp_path):
+    path = str(tmp_path / "schema.sqlite3")
+    db = nkapi.NKDBSqlite3(database=path, schema_check_interval=0)
+    db.table_create("a", {"id": "INTEGER"})
+    assert db.table_list() == ["a"]
+
+    db.execute('ALTER TABLE "a" ADD COLUMN "name" TEXT;', commit=True)
+    assert list(db.table_columns("a")) == ["id", "name"]
+
+    other = nkapi.NKDBSqlite3(database=path)
+    other.table_create("b", {"id": "INTEGER"})
+    assert db.table_list() == ["a", "b"]
+
+    db.table_drop("b")
+    assert not db.table_exists("b")
+
+def test_check_columns_rejects_unknown_columns():
+    db = make_db(check_columns=True)
+    db.insert("items", {"name": "a"})
+    try:
+        db.update("items", {"colour": "red"})
+    except ValueError as error:
+        assert "colour" in str(error)
+    else:
+        assert False
+
+def test_backup_copies_database_with_progress(tmp_path):
+    db = nkapi.NKDBSqlite3(database=str(tmp_path / "source.sqlite3"))
+    db.table_create("items", {"id": "INTEGER PRIMARY KEY", "name": "TEXT"})
+    db.executemany('INSERT INTO "items" ("name") VALUES (?);', [("x" * 500,) for _ in range(100)])
+
+    steps = []
+    result = db.backup(str(tmp_path / "copy.sqlite3"), pages_per_step=5, progress=lambda status, remaining, total: steps.append(remaining))
+    assert result["pages"] > 5
+    assert len(steps) > 1
+
+    copy = nkapi.NKDBSqlite3(database=str(tmp_path / "copy.sqlite3"))
+    assert copy.execute('SELECT COUNT(*) FROM "items";').fetchone()[0] == 100
+
+    target = make_db()
+    db.backup(target)
+    assert len(target.select("items")) == 100
+
+def test_replica_serves_reads_and_refreshes(tmp_path):
+    db = nkapi.NKDBSqlite3(database=str(tmp_path / "source.sqlite3"), return_dicts=True)
+    db.table_create("items", {"id": "INTEGER PRIMARY KEY", "name": "TEXT"})
+    db.insert("items", {"name": "a"})
+
+    replica = nkapi.NKDBSqlite3Replica(db, result_cache=True)
+    assert replica.select("items") == [{"id": 1, "name": "a"}]
+    try:
+        replica.insert("items", {"name": "b"})
+    except Exception:
+        pass
+    else:
+        assert False
+
+    db.insert("items", {"name": "b"})
+    assert len(replica.select("items")) == 1
+    replica.refresh()
+    assert len(replica.select("items")) == 2
+    assert replica.refresh_count == 2
+    replica.close()
+
+def test_fts_search_ranks_and_highlights():
+    db = make_db(return_dicts=True)
+    db.table_create("docs", {"id": "INTEGER PRIMARY KEY", "title": "TEXT", "body": "TEXT"})
+    db.insert("docs", {"title": "sqlite tips", "body": "use an index"})
+    db.fts_create("docs", ["title", "body"])
+    db.insert("docs", {"title": "python", "body": "sqlite sqlite sqlite everywhere"})
+    db.insert("docs", {"title": "cooking", "body": "pasta"})
+
+    results = db.search("docs", "sqlite", highlight="body")
+    assert [row["id"] for row in results] == [2, 1]
+    assert results[0]["body_highlight"] == "<b>sqlite</b> <b>sqlite</b> <b>sqlite</b> everywhere"
+    assert results[0]["rank"] <= results[1]["rank"]
+
+    db.update("docs", {"body": "nothing here"}, where="id = ?", params=(2,))
+    db.delete("docs", where="id = ?", params=(1,))
+    assert db.search("docs", "sqlite") == []
+    assert db.search("docs", 'pasta "OR') == []
+    assert db.search("docs", "pasta", columns=["title"]) == [{"title": "cooking", "rank": db.search("docs", "pasta")[0]["rank"]}]
+
+    db.fts_drop("docs")
+    assert not db.table_exists("docs_fts")
+
+def test_json_response_streams_rows_in_batches():
+    db = make_db(return_dicts=True)
+    db.executemany('INSERT INTO "items" ("name", "price") VALUES (?, ?);', [(f"n{i}", i) for i in range(5)])
+
+    response = db.json_response("items", columns=["id", "name"], where="price < ?", params=(4,), order_by="id", batch_size=2)
+    chunks = list(response.iter_body())
+    assert len(chunks) == 4
+    assert json.loads(b"".join(chunks)) == [{"id": i + 1, "name": f"n{i}"} for i in range(4)]
+
+def test_iterate_yields_all_rows_and_closes_cursor():
+    db = make_db()
+    db.executemany('INSERT INTO "items" ("name", "price") VALUES (?, ?);', [(f"n{i}", i) for i in range(5)])
+
+    names = [row[1] for row in db.iterate("items", order_by="id", batch_size=2)]
+    assert names == [f"n{i}" for i in range(5)]
+    iterator = db.iterate("items", batch_size=2)
+    next(iterator)
+    iterator.close()
+
+def test_queries_are_interrupted_once_the_deadline_expires():
+    db = make_db()
+    slow_query = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) SELECT count(*) FROM n"
+
+    with nkapi.NKDeadline(0.05):
+        start_time = time.monotonic()
+        try:
+            db.execute(slow_query)
+            assert False
+        except sqlite3.OperationalError:
+            pass
+        assert time.monotonic() - start_time < 1.0
+
+    with nkapi.NKDeadline(0.0):
+        try:
+            db.select("items")
+            assert False
+        except sqlite3.OperationalError as error:
+            assert "deadline" in str(error)
+
+    assert db.select("items") == []
+
+def test_cursor_paths_are_interrupted_once_the_deadline_expires():
+    db = make_db()
+    db.execute("CREATE VIEW numbers AS WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) SELECT x FROM n", commit=True)
+
+    for consume in (
+        lambda: db.select_columns("numbers", use_numpy=False),
+        lambda: list(db.iterate("numbers", batch_size=1000)),
+        lambda: b"".join(db.json_response("numbers").iter_body())
+    ):
+        with nkapi.NKDeadline(0.05):
+            start_time = time.monotonic()
+            try:
+                consume()
+                assert False
+            except sqlite3.OperationalError:
+                pass
+            assert time.monotonic() - start_time < 1.0
+    assert db.select("items") == []
+
+def test_async_lanes_share_one_result_cache(tmp_path):
+    async def scenario():
+        async with nkapi.NKDBSqlite3Async(str(tmp_path / "lanes.sqlite3"), workers=2, result_cache=True) as db:
+            await db.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)", commit=True)
+            for index in range(4):
+                await db.insert("items", {"name": f"n{index}"})
+                assert len(await db.select("items")) == index + 1
+            assert db._databases[0].result_cache is db._databases[1].result_cache
+
+    asyncio.run(scenario())
+
+def test_async_memory_database_uses_a_single_lane():
+    async def scenario():
+        async with nkapi.NKDBSqlite3Async(":memory:", workers=4) as db:
+            assert db.workers == 1
+            await db.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)", commit=True)
+            await db.insert("items", {"name": "a"})
+            assert await db.select("items") == [(1, "a")]
+
+    asyncio.run(scenario())
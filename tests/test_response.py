@@ -171,3 +171,15 @@ def test_response_body_object_with_str_returns_bytes():
     response = nkapi.NKResponse(body=obj)
     assert response.body == b"custom"
     assert response.headers["Content-Length"] == str(len(b"custom"))
+
+def test_streaming_response_yields_encoded_chunks_without_content_length():
+    response = nkapi.NKStreamingResponse(body=(part for part in ["a", b"b", "", "c"]))
+    assert list(response.iter_body()) == [b"a", b"b", b"c"]
+    assert "Content-Length" not in response.headers
+    assert response.headers["Content-Type"] == "application/octet-stream"
+
+def test_streaming_response_json_array_from_batches():
+    response = nkapi.NKStreamingResponse.json_array(iter([[{"a": 1}, {"a": 2}], [], [{"a": 3}]]))
+    assert response.headers["Content-Type"] == "application/json"
+    assert json.loads(response.body) == [{"a": 1}, {"a": 2}, {"a": 3}]
+    assert json.loads(nkapi.NKStreamingResponse.json_array([]).body) == []
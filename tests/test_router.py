@@ -1,3 +1,6 @@
+import json
+import time
+import threading
 import nkapi
 
 def default_view(request):
@@ -241,3 +244,240 @@ def test_router_parameters_with_reserved_characters():
     request = nkapi.NKRequest("GET", f"/reserved/{reserved_chars}")
     result = router.handle(request)
     assert result["params"]["param"] == reserved_chars
+
+def test_router_metrics_count_requests_per_route_and_status():
+    router = nkapi.NKRouter()
+    metrics = router.enable_metrics(buckets=[0.5, 1.0])
+    router.register(["GET"], "/user/<id>", lambda r: nkapi.NKResponse(body="ok"))
+
+    router.handle(nkapi.NKRequest("GET", "/user/1"))
+    router.handle(nkapi.NKRequest("GET", "/user/2"))
+    router.handle(nkapi.NKRequest("GET", "/missing"))
+
+    snapshot = metrics.snapshot()
+    assert snapshot["requests"][("/user/<id>", "GET", 200)] == 2
+    assert snapshot["requests"][("<unmatched>", "GET", 404)] == 1
+    assert snapshot["in_flight"][("/user/<id>", "GET")] == 0
+    assert sum(snapshot["histograms"][("/user/<id>", "GET")][0]) == 2
+
+def test_router_metrics_endpoint_renders_prometheus_text():
+    router = nkapi.NKRouter()
+    router.enable_metrics()
+    router.register(["GET"], "/boom", lambda r: 1 / 0)
+    router.handle(nkapi.NKRequest("GET", "/boom"))
+
+    response = router.handle(nkapi.NKRequest("GET", "/metrics"))
+    text = response.body.decode()
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert 'nkapi_requests_total{route="/boom",method="GET",status="500"} 1' in text
+    assert 'nkapi_request_duration_seconds_bucket{route="/boom",method="GET",le="+Inf"} 1' in text
+    assert 'nkapi_requests_in_flight{route="/metrics",method="GET"} 1' in text
+
+def busy_view(request):
+    total = 0
+    for index in range(20000):
+        total += index * index
+    return nkapi.NKResponse(body=str(total))
+
+def test_router_cprofile_profiling_by_route_and_header(tmp_path):
+    router = nkapi.NKRouter()
+    profiler = router.enable_profiling(routes=["/busy"], directory=str(tmp_path), path="/_profile", header_value="secret")
+    router.register(["GET"], "/busy", busy_view)
+    router.register(["GET"], "/other", busy_view)
+
+    router.handle(nkapi.NKRequest("GET", "/busy"))
+    router.handle(nkapi.NKRequest("GET", "/other"))
+    router.handle(nkapi.NKRequest("GET", "/other", headers={"X-NKAPI-Profile": "1"}))
+    router.handle(nkapi.NKRequest("GET", "/other", headers={"X-NKAPI-Profile": "secret"}))
+    assert profiler.requests == {"/busy": 1, "/other": 1}
+
+    assert router.handle(nkapi.NKRequest("GET", "/_profile")).status == 403
+    secret = {"X-NKAPI-Profile": "secret"}
+    report = router.handle(nkapi.NKRequest("GET", "/_profile", headers=secret)).body.decode()
+    assert "=== /busy (1 requests) ===" in report
+    assert "busy_view" in report
+
+    router.handle(nkapi.NKRequest("GET", "/_profile", query={"dump": ["1"]}, headers=secret))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["busy.pstats", "other.pstats"]
+
+def test_router_profiling_is_opt_in_and_locked_down_by_default():
+    router = nkapi.NKRouter()
+    profiler = router.enable_profiling()
+    router.register(["GET"], "/busy", busy_view)
+
+    assert router.handle(nkapi.NKRequest("GET", "/_profile")).status == 404
+    router.handle(nkapi.NKRequest("GET", "/busy", headers={"X-NKAPI-Profile": "1"}))
+    assert profiler.requests == {}
+
+    profiler.header_value = "secret"
+    router.enable_profiling(profiler, path="/_profile")
+    assert router.handle(nkapi.NKRequest("GET", "/_profile", query={"reset": ["1"]})).status == 403
+    assert router.handle(nkapi.NKRequest("GET", "/_profile", headers={"X-NKAPI-Profile": "é"})).status == 403
+    assert router.handle(nkapi.NKRequest("GET", "/busy", headers={"X-NKAPI-Profile": "é"})).status == 200
+    secret = {"X-NKAPI-Profile": "secret"}
+    assert router.handle(nkapi.NKRequest("GET", "/_profile", query={"dump": ["1"]}, headers=secret)).status == 400
+
+def test_router_sampling_profiler_collects_collapsed_stacks():
+    def slow_view(request):
+        time.sleep(0.05)
+        return nkapi.NKResponse(body="ok")
+
+    router = nkapi.NKRouter()
+    profiler = router.enable_profiling(mode="sampling", sample_rate=1.0, interval=0.001)
+    router.register(["GET"], "/slow", slow_view)
+
+    router.handle(nkapi.NKRequest("GET", "/slow"))
+    profiler.close()
+    assert "/slow;test_router.py:slow_view" in profiler.collapsed()
+
+def test_router_view_timeout_returns_gateway_timeout():
+    def slow_view(request):
+        time.sleep(0.3)
+        return nkapi.NKResponse(body="late")
+
+    def fast_view(request):
+        return {"remaining": request.deadline.remaining() > 0}
+
+    router = nkapi.NKRouter()
+    router.register(["GET"], "/slow", slow_view, timeout=0.05)
+    router.register(["GET"], "/fast", fast_view, timeout=1.0)
+
+    start_time = time.monotonic()
+    assert router.handle(nkapi.NKRequest("GET", "/slow")).status == 504
+    assert time.monotonic() - start_time < 0.25
+    assert router.handle(nkapi.NKRequest("GET", "/fast")) == {"remaining": True}
+
+def test_router_default_timeout_applies_to_routes_without_one():
+    def slow_view(request):
+        time.sleep(0.2)
+        return nkapi.NKResponse(body="late")
+
+    router = nkapi.NKRouter(default_timeout=0.05)
+    router.register(["GET"], "/slow", slow_view)
+    router.register(["GET"], "/patient", slow_view, timeout=1.0)
+
+    assert router.handle(nkapi.NKRequest("GET", "/slow")).status == 504
+    assert router.handle(nkapi.NKRequest("GET", "/patient")).status == 200
+
+def test_router_batch_dispatches_sub_requests_in_order():
+    def item_view(request):
+        return nkapi.NKResponse(body={"id": request.params["id"], "q": request.query.get("q")})
+
+    def echo_view(request):
+        return nkapi.NKResponse(body={"body": request.body, "auth": request.headers.get("Authorization")})
+
+    router = nkapi.NKRouter()
+    router.register(["GET"], "/items/<id>", item_view)
+    router.register(["POST"], "/echo", echo_view)
+    router.register(["GET"], "/text", lambda request: nkapi.NKResponse(body="plain"))
+    router.enable_batch(workers=4)
+
+    request = nkapi.NKRequest("POST", "/batch", headers={"Authorization": "Bearer t"}, body=[
+        {"method": "GET", "path": "/items/1", "query": {"q": "a"}},
+        {"method": "GET", "path": "/items/2?q=b"},
+        {"method": "POST", "path": "/echo", "body": {"x": 1}},
+        {"method": "GET", "path": "/text"},
+        {"method": "GET", "path": "/missing"},
+        {"method": "POST", "path": "/batch", "body": []}
+    ])
+    results = json.loads(router.handle(request).body)
+
+    assert [r["status"] for r in results] == [200, 200, 200, 200, 404, 400]
+    assert results[0]["body"] == {"id": "1", "q": "a"}
+    assert results[1]["body"] == {"id": "2", "q": "b"}
+    assert results[2]["body"] == {"body": {"x": 1}, "auth": "Bearer t"}
+    assert results[3]["body"] == "plain"
+
+def test_router_batch_rejects_non_arrays_and_oversized_batches():
+    router = nkapi.NKRouter()
+    router.enable_batch(max_requests=2)
+
+    assert router.handle(nkapi.NKRequest("POST", "/batch", body={"path": "/"})).status == 400
+    assert router.handle(nkapi.NKRequest("POST", "/batch", body=[{"path": "/"}] * 3)).status == 413
+
+def test_router_batch_rejects_malformed_items_individually():
+    router = nkapi.NKRouter()
+    router.register(["GET"], "/ok", lambda request: nkapi.NKResponse(body="ok"))
+    router.enable_batch()
+
+    request = nkapi.NKRequest("POST", "/batch", body=[
+        {"path": "/ok", "query": ["a"]},
+        {"path": "/ok", "query": {"a": {"b": 1}}},
+        {"path": "/ok", "headers": "X-Test: 1"},
+        {"path": "/ok", "headers": {"X-Test": [1]}},
+        {"path": "/ok", "method": 5},
+        {"path": "/ok", "query": {"n": 1}, "headers": {"X-Test": 2}}
+    ])
+    response = router.handle(request)
+    assert response.status == 200
+    assert [r["status"] for r in json.loads(response.body)] == [400, 400, 400, 400, 400, 200]
+
+def test_router_hung_views_do_not_starve_other_timed_routes():
+    release = threading.Event()
+
+    def hang_view(request):
+        release.wait(2.0)
+        return nkapi.NKResponse(body="late")
+
+    router = nkapi.NKRouter(default_timeout=0.05)
+    router.register(["GET"], "/hang", hang_view)
+    router.register(["GET"], "/fast", lambda request: nkapi.NKResponse(body="fast"))
+
+    try:
+        assert [router.handle(nkapi.NKRequest("GET", "/hang")).status for _ in range(4)] == [504] * 4
+        assert router.handle(nkapi.NKRequest("GET", "/fast")).status == 200
+    finally:
+        release.set()
+
+def test_router_timed_view_errors_still_return_500():
+    def broken_view(request):
+        raise RuntimeError("boom")
+
+    router = nkapi.NKRouter()
+    router.register(["GET"], "/broken", broken_view, timeout=1.0)
+    assert router.handle(nkapi.NKRequest("GET", "/broken")).status == 500
+
+def test_router_caps_abandoned_views_and_reuses_view_threads():
+    release = threading.Event()
+    threads = set()
+
+    def hang_view(request):
+        release.wait(2.0)
+        return nkapi.NKResponse(body="late")
+
+    def fast_view(request):
+        threads.add(threading.get_ident())
+        return nkapi.NKResponse(body="fast")
+
+    router = nkapi.NKRouter(default_timeout=0.05, max_abandoned_views=2)
+    router.register(["GET"], "/hang", hang_view)
+    router.register(["GET"], "/fast", fast_view)
+
+    for _ in range(5):
+        assert router.handle(nkapi.NKRequest("GET", "/fast")).status == 200
+    assert len(threads) == 1
+
+    try:
+        assert [router.handle(nkapi.NKRequest("GET", "/hang")).status for _ in range(2)] == [504, 504]
+        response = router.handle(nkapi.NKRequest("GET", "/fast"))
+        assert response.status == 503
+        assert response.headers["Retry-After"] == "1"
+    finally:
+        release.set()
+
+    for _ in range(100):
+        if router.abandoned_views == 0:
+            break
+        time.sleep(0.01)
+    assert router.handle(nkapi.NKRequest("GET", "/fast")).status == 200
+
+def test_router_metrics_spread_threads_across_stripes():
+    metrics = nkapi.NKMetrics(stripes=4)
+    stripes = []
+    threads = [threading.Thread(target=lambda: stripes.append(metrics._stripe())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(stripe) for stripe in stripes}) == 4
+    assert metrics._stripe() is metrics._stripe()
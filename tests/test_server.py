@@ -1,6 +1,7 @@
 import io
 import time
 import json
+import socket
 import nkapi
 import requests
 import threading
@@ -251,3 +252,422 @@ def test_wsgi_multiple_routes_same_path_different_methods():
     
     assert body_get == b"get"
     assert body_post == b"post"
+
+def test_wsgi_streaming_response_is_returned_incrementally():
+    server = nkapi.NKServer()
+    server.router.register(["GET"], "/stream",
+        lambda r: nkapi.NKStreamingResponse.json_array(iter([[1, 2], [3]]))
+    )
+
+    status, headers, body = run_wsgi_app(server.wsgi_app, "GET", "/stream")
+    assert status.startswith("200")
+    assert "Content-Length" not in headers
+    assert json.loads(body) == [1, 2, 3]
+
+def test_access_logger_writes_json_lines_in_background():
+    stream = io.StringIO()
+    logger = nkapi.NKAccessLogger(format="json", stream=stream)
+    logger.log("127.0.0.1", "GET", "/a", "HTTP/1.1", 200, 5, 0.002)
+    logger.message("code 400, message Bad request")
+    logger.close()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert lines[0]["path"] == "/a"
+    assert lines[0]["size"] == 5
+    assert lines[1]["message"].startswith("code 400")
+
+def test_access_logger_sampling_keeps_server_errors():
+    stream = io.StringIO()
+    logger = nkapi.NKAccessLogger(format="common", stream=stream, sample_rate=0.0)
+    logger.log("127.0.0.1", "GET", "/ok", "HTTP/1.1", 200, 2, 0.001)
+    logger.log("127.0.0.1", "GET", "/bad", "HTTP/1.1", 500, 3, 0.001)
+    logger.close()
+
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 1
+    assert lines[0].endswith('"GET /bad HTTP/1.1" 500 3')
+
+def test_wsgi_access_log_records_size_and_duration():
+    stream = io.StringIO()
+    server = nkapi.NKServer(access_log=nkapi.NKAccessLogger(format="json", stream=stream), wsgi_access_log=True)
+    server.router.register(["GET"], "/logged", lambda r: nkapi.NKResponse(body="hello"))
+
+    run_wsgi_app(server.wsgi_app, "GET", "/logged", query="x=1")
+    server.access_logger.close()
+
+    record = json.loads(stream.getvalue())
+    assert record["path"] == "/logged?x=1"
+    assert record["status"] == 200
+    assert record["size"] == 5
+    assert record["duration"] >= 0
+
+def test_middleware_chain_wraps_router_in_registration_order():
+    server = nkapi.NKServer()
+    calls = []
+    server.router.register(["GET"], "/mw", lambda r: calls.append("view") or nkapi.NKResponse(body="ok"))
+
+    def outer(next_handler):
+        def handler(request):
+            calls.append("outer")
+            return next_handler(request)
+        return handler
+
+    server.use(outer)
+    server.before_request(lambda request: calls.append("before"))
+
+    @server.after_request
+    def add_header(request, response):
+        response.headers["X-After"] = "1"
+
+    status, headers, body = run_wsgi_app(server.wsgi_app, "GET", "/mw")
+    assert calls == ["outer", "before", "view"]
+    assert headers["X-After"] == "1"
+
+def test_before_request_can_short_circuit():
+    server = nkapi.NKServer()
+    server.router.register(["GET"], "/secret", lambda r: nkapi.NKResponse(body="secret"))
+    server.before_request(lambda request: nkapi.NKResponse(body="denied", status=401) if not request.headers.get("Authorization") else None)
+
+    status, _, body = run_wsgi_app(server.wsgi_app, "GET", "/secret")
+    assert status.startswith("401")
+    status, _, body = run_wsgi_app(server.wsgi_app, "GET", "/secret", headers={"Authorization": "token"})
+    assert body == b"secret"
+
+def test_wsgi_applies_cors_headers_and_preflight():
+    server = nkapi.NKServer(cors_origins=["https://app.example"])
+    server.router.register(["GET", "POST"], "/c", lambda r: nkapi.NKResponse(body="ok"))
+
+    _, headers, _ = run_wsgi_app(server.wsgi_app, "GET", "/c", headers={"Origin": "https://app.example"})
+    assert headers["Access-Control-Allow-Origin"] == "https://app.example"
+    assert headers["Vary"] == "Origin"
+
+    _, headers, _ = run_wsgi_app(server.wsgi_app, "GET", "/c", headers={"Origin": "https://evil.example"})
+    assert "Access-Control-Allow-Origin" not in headers
+
+    server.router.register(["GET"], "/v", lambda r: nkapi.NKResponse(body="ok", headers={"Vary": "Accept-Encoding"}))
+    _, headers, _ = run_wsgi_app(server.wsgi_app, "GET", "/v", headers={"Origin": "https://app.example"})
+    assert headers["Vary"] == "Accept-Encoding, Origin"
+
+    server.router.register(["GET"], "/o", lambda r: nkapi.NKResponse(body="ok", headers={"Vary": "origin"}))
+    _, headers, _ = run_wsgi_app(server.wsgi_app, "GET", "/o", headers={"Origin": "https://app.example"})
+    assert headers["Vary"] == "origin"
+
+    status, headers, _ = run_wsgi_app(server.wsgi_app, "OPTIONS", "/c", headers={"Origin": "https://app.example"})
+    assert status.startswith("200")
+    assert headers["Access-Control-Allow-Methods"] == "GET, OPTIONS, POST"
+    assert headers["Access-Control-Allow-Headers"] == "Content-Type, Authorization"
+
+def test_cors_wildcard_origins_and_max_age():
+    server = nkapi.NKServer(cors_origins=["https://*.example.com"], cors_max_age=3600)
+    server.router.register(["GET"], "/c", lambda r: nkapi.NKResponse(body="ok"))
+
+    _, headers, _ = run_wsgi_app(server.wsgi_app, "OPTIONS", "/c", headers={"Origin": "https://api.example.com"})
+    assert headers["Access-Control-Allow-Origin"] == "https://api.example.com"
+    assert headers["Access-Control-Max-Age"] == "3600"
+    assert headers["Access-Control-Allow-Methods"] == "GET, OPTIONS"
+
+    _, headers, _ = run_wsgi_app(server.wsgi_app, "OPTIONS", "/c", headers={"Origin": "https://example.org"})
+    assert "Access-Control-Allow-Origin" not in headers
+    assert "Access-Control-Max-Age" not in headers
+
+def test_cors_preflight_methods_follow_new_routes():
+    server = nkapi.NKServer()
+    server.router.register(["GET"], "/c", lambda r: nkapi.NKResponse(body="ok"))
+    _, headers, _ = run_wsgi_app(server.wsgi_app, "OPTIONS", "/c", headers={"Origin": "https://a.example"})
+    assert headers["Access-Control-Allow-Methods"] == "GET, OPTIONS"
+
+    server.router.register(["DELETE"], "/c", lambda r: nkapi.NKResponse(body="gone"))
+    _, headers, _ = run_wsgi_app(server.wsgi_app, "OPTIONS", "/c", headers={"Origin": "https://a.example"})
+    assert headers["Access-Control-Allow-Methods"] == "DELETE, GET, OPTIONS"
+
+def test_admission_controller_sheds_load_with_retry_after():
+    release = threading.Event()
+    server = nkapi.NKServer()
+    controller = server.use(nkapi.NKAdmissionController(limit=1, adaptive=False, queue_timeout=0.01, retry_after=3, priorities={"/health": "critical"}))
+    server.router.register(["GET"], "/slow", lambda r: release.wait(2) and nkapi.NKResponse(body="done"))
+    server.router.register(["GET"], "/health", lambda r: nkapi.NKResponse(body="ok"))
+
+    results = []
+    worker = threading.Thread(target=lambda: results.append(run_wsgi_app(server.wsgi_app, "GET", "/slow")))
+    worker.start()
+    time.sleep(0.05)
+
+    status, headers, body = run_wsgi_app(server.wsgi_app, "GET", "/slow")
+    assert status.startswith("503")
+    assert headers["Retry-After"] == "3"
+    assert run_wsgi_app(server.wsgi_app, "GET", "/health")[2] == b"ok"
+
+    release.set()
+    worker.join()
+    assert results[0][2] == b"done"
+    assert controller.stats()["rejected"] == 1
+    assert controller.stats()["in_flight"] == 0
+
+def test_admission_controller_adapts_limit_to_latency():
+    controller = nkapi.NKAdmissionController(limit=10, min_limit=2)
+    for _ in range(20):
+        assert controller.acquire(1)
+        controller.release(0.001)
+    grown = controller.limit
+    assert grown > 10
+    for _ in range(50):
+        assert controller.acquire(1)
+        controller.release(0.1)
+    assert controller.limit < grown
+
+def test_rate_limiter_returns_429_after_bucket_is_empty():
+    server = nkapi.NKServer()
+    limiter = server.use(nkapi.NKRateLimiter(rate=0.001, capacity=2, key_header="X-Api-Key"))
+    server.router.register(["GET"], "/r", lambda r: nkapi.NKResponse(body="ok"))
+
+    statuses = [run_wsgi_app(server.wsgi_app, "GET", "/r", headers={"X-Api-Key": "a"})[0][:3] for _ in range(3)]
+    assert statuses == ["200", "200", "429"]
+    status, headers, _ = run_wsgi_app(server.wsgi_app, "GET", "/r", headers={"X-Api-Key": "a"})
+    assert int(headers["Retry-After"]) > 1
+    assert run_wsgi_app(server.wsgi_app, "GET", "/r", headers={"X-Api-Key": "b"})[0].startswith("200")
+    assert limiter.limited == 2
+
+def test_memory_bucket_store_refills_lazily_and_evicts_idle_keys():
+    store = nkapi.NKMemoryBucketStore(stripes=1, max_keys=2)
+    assert store.take("a", rate=1, capacity=1, now=0) == (True, 0.0)
+    assert store.take("a", rate=1, capacity=1, now=0.5) == (False, 0.5)
+    assert store.take("a", rate=1, capacity=1, now=1.0)[0]
+    store.take("b", rate=1, capacity=1, now=1.0)
+    store.take("c", rate=1, capacity=1, now=1.0)
+    assert len(store) == 2
+    assert store.evictions == 1
+
+def test_sqlite_bucket_store_shares_buckets_between_instances(tmp_path):
+    path = str(tmp_path / "limits.sqlite3")
+    first = nkapi.NKSqliteBucketStore(nkapi.NKDBSqlite3(database=path))
+    second = nkapi.NKSqliteBucketStore(nkapi.NKDBSqlite3(database=path))
+
+    assert first.take("k", rate=1, capacity=2, now=100.0) == (True, 1.0)
+    assert second.take("k", rate=1, capacity=2, now=100.0) == (True, 0.0)
+    assert first.take("k", rate=1, capacity=2, now=100.5) == (False, 0.5)
+    assert second.take("k", rate=1, capacity=2, now=101.0) == (True, 0.0)
+
+def test_deferred_tasks_run_after_the_wsgi_body_is_closed():
+    server = nkapi.NKServer(access_log=False)
+    done = threading.Event()
+    calls = []
+
+    def view(request):
+        request.defer(lambda value: (calls.append(value), done.set()), "sent")
+        return nkapi.NKResponse(body="ok")
+
+    server.router.register(["POST"], "/signup", view)
+    environ = {}
+    setup_testing_defaults(environ)
+    environ["REQUEST_METHOD"] = "POST"
+    environ["PATH_INFO"] = "/signup"
+    body = server.wsgi_app(environ, lambda status, headers: None)
+
+    assert b"".join(body) == b"ok"
+    assert calls == []
+    body.close()
+    assert done.wait(1.0)
+    assert calls == ["sent"]
+    assert server.tasks.close(timeout=1.0)
+
+def test_task_queue_drains_on_close_and_reports_metrics():
+    tasks = nkapi.NKTaskQueue(workers=2, queue_size=2)
+    release = threading.Event()
+    results = []
+
+    for i in range(2):
+        tasks.submit(lambda i=i: (release.wait(1.0), results.append(i)))
+    time.sleep(0.05)
+    tasks.submit(results.append, 2)
+    tasks.submit(results.append, 3)
+    assert tasks.submit(results.append, 4) is False
+
+    router = nkapi.NKRouter()
+    router.tasks = tasks
+    router.enable_metrics()
+    text = router.handle(nkapi.NKRequest("GET", "/metrics")).body.decode()
+    assert "nkapi_tasks_queued 2" in text
+    assert "nkapi_tasks_running 2" in text
+    assert 'nkapi_tasks_total{result="dropped"} 1' in text
+
+    release.set()
+    assert tasks.close(timeout=1.0)
+    assert sorted(results) == [0, 1, 2, 3]
+    assert tasks.submit(results.append, 5) is False
+    assert tasks.stats()["completed"] == 4
+
+def test_stop_drains_in_flight_requests_before_closing():
+    server = nkapi.NKServer(host="127.0.0.1", port=0, access_log=False, shutdown_timeout=2.0)
+    started = threading.Event()
+
+    def slow_view(request):
+        started.set()
+        time.sleep(0.3)
+        return nkapi.NKResponse(body="finished")
+
+    server.router.register(["GET"], "/slow", slow_view)
+    thread = start_test_server(server)
+    url = f"http://127.0.0.1:{server.port}"
+
+    results = []
+    client = threading.Thread(target=lambda: results.append(requests.get(url + "/slow")))
+    client.start()
+    assert started.wait(1.0)
+    server.stop()
+    thread.join(2.0)
+    client.join(2.0)
+
+    assert not thread.is_alive()
+    assert results[0].status_code == 200 and results[0].text == "finished"
+    try:
+        requests.get(url + "/slow", timeout=0.5)
+        assert False
+    except requests.exceptions.ConnectionError:
+        pass
+
+def test_start_adopts_a_handed_off_listening_socket(monkeypatch):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    port = listener.getsockname()[1]
+    monkeypatch.setenv("NKAPI_LISTEN_FD", str(listener.detach()))
+
+    server = nkapi.NKServer(host="127.0.0.1", port=0, access_log=False)
+    server.router.register(["GET"], "/hello", lambda request: nkapi.NKResponse(body="inherited"))
+    thread = start_test_server(server)
+
+    assert server.port == port
+    assert requests.get(f"http://127.0.0.1:{port}/hello").text == "inherited"
+    server.stop()
+    thread.join(2.0)
+    assert not thread.is_alive()
+
+def unix_get(path, target):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(str(path))
+        client.sendall(f"GET {target} HTTP/1.0\r\nHost: localhost\r\n\r\n".encode())
+        data = b""
+        while chunk := client.recv(65536):
+            data += chunk
+    return data
+
+def test_server_listens_on_a_unix_domain_socket(tmp_path):
+    path = tmp_path / "nkapi.sock"
+    server = nkapi.NKServer(unix_socket=str(path), access_log=False)
+    server.router.register(["GET"], "/hello", lambda request: nkapi.NKResponse(body=f"hi {request.client_address[0]}"))
+    thread = start_test_server(server)
+
+    response = unix_get(path, "/hello")
+    assert response.startswith(b"HTTP/1.0 200")
+    assert response.endswith(b"hi unix")
+    assert server.url == f"http+unix://{path}"
+
+    server.stop()
+    thread.join(2.0)
+    assert not thread.is_alive()
+    assert not path.exists()
+
+def test_server_adopts_a_pre_bound_unix_socket_fd(tmp_path):
+    path = tmp_path / "bound.sock"
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(str(path))
+
+    server = nkapi.NKServer(fd=listener.detach(), access_log=False)
+    server.router.register(["GET"], "/hello", lambda request: nkapi.NKResponse(body="pre-bound"))
+    thread = start_test_server(server)
+
+    assert unix_get(path, "/hello").endswith(b"pre-bound")
+    server.stop()
+    thread.join(2.0)
+    assert path.exists()
+
+def test_test_client_dispatches_in_process_with_middleware():
+    server = nkapi.NKServer(access_log=False)
+    deferred = []
+
+    def create(request):
+        request.defer(deferred.append, request.body["name"])
+        return nkapi.NKResponse(status=201, body={"name": request.body["name"], "page": request.query.get("page")})
+
+    server.router.register(["POST"], "/items", create)
+    server.after_request(lambda request, response: response.headers.__setitem__("X-Seen", "yes"))
+    client = server.test_client(headers={"Origin": "http://example.com"})
+
+    response = client.post("/items?page=2", json_body={"name": "a"})
+    assert response.status == 201
+    assert response.json() == {"name": "a", "page": "2"}
+    assert response.headers["X-Seen"] == "yes"
+    assert response.headers["Access-Control-Allow-Origin"] == "*"
+    assert deferred == ["a"]
+
+    response = server.test_client(wsgi=True).post("/items", json_body={"name": "b"})
+    assert response.status == 201
+    assert deferred == ["a", "b"]
+
+    assert client.get("/missing").status == 404
+    assert client.options("/items").status == 200
+
+def test_test_client_wsgi_mode_matches_in_process_mode():
+    server = nkapi.NKServer(access_log=False)
+    server.router.register(["GET"], "/hello/<name>", lambda request: nkapi.NKResponse(body=f"hi {request.params['name']} {request.query.get('x')}"))
+
+    for client in (server.test_client(), server.test_client(wsgi=True)):
+        response = client.get("/hello/bob", query={"x": "1"})
+        assert response.status == 200
+        assert response.text == "hi bob 1"
+        assert response.headers["Content-Type"] == "text/plain; charset=utf-8"
+        assert client.head("/hello/bob").data == b""
+
+def test_batch_sub_requests_go_through_the_middleware_chain():
+    server = nkapi.NKServer(access_log=False)
+    server.router.register(["GET"], "/admin/secret", lambda request: nkapi.NKResponse(body="SECRET"))
+    server.router.register(["GET"], "/public", lambda request: nkapi.NKResponse(body="ok"))
+    server.enable_batch()
+
+    @server.before_request
+    def guard(request):
+        if request.path.startswith("/admin") and request.headers.get("Authorization") != "Bearer admin":
+            return nkapi.NKResponse(body="401 Unauthorized", status=401)
+
+    limiter = server.use(nkapi.NKRateLimiter(rate=0.001, capacity=3, limits={"/public": (0.001, 2)}))
+    client = server.test_client()
+
+    assert client.get("/admin/secret").status == 401
+    results = client.post("/batch", json_body=[{"method": "GET", "path": "/admin/secret"}]).json()
+    assert results[0]["status"] == 401
+    assert results[0]["body"] == "401 Unauthorized"
+
+    results = client.post("/batch", json_body=[{"method": "GET", "path": "/public"}] * 5).json()
+    assert [r["status"] for r in results] == [200, 200, 429, 429, 429]
+    assert limiter.limited == 3
+
+def test_rate_limiter_keys_on_the_matched_route():
+    server = nkapi.NKServer(access_log=False)
+    limiter = server.use(nkapi.NKRateLimiter(rate=0.001, capacity=1))
+    assert limiter.router is server.router
+    server.router.register(["GET"], "/user/<id>", lambda request: nkapi.NKResponse(body="ok"))
+    client = server.test_client()
+
+    statuses = [client.get(path).status for path in ("/user/1", "/user/2", "/user/1/", "/user/1//", "/missing/1", "/missing/2")]
+    assert statuses == [200, 429, 429, 429, 404, 429]
+    assert sum(len(stripe.buckets) for stripe in limiter.store.stripes) == 2
+
+def test_server_passes_task_settings_to_its_queue():
+    server = nkapi.NKServer(access_log=False, task_workers=2, task_queue_size=5, task_drain_timeout=1.5)
+    assert (server.tasks.workers, server.tasks.queue.maxsize, server.tasks.drain_timeout) == (2, 5, 1.5)
+
+def test_cors_preflight_methods_are_cached_per_route_pattern():
+    server = nkapi.NKServer(access_log=False)
+    server.router.register(["GET"], "/user/<id>", lambda request: nkapi.NKResponse(body="get"))
+    server.router.register(["DELETE"], "/user/<uid>", lambda request: nkapi.NKResponse(body="delete"))
+    server.router.register(["GET"], "/team/<id>", lambda request: nkapi.NKResponse(body="team"))
+    server.router.register(["POST"], "/team/new", lambda request: nkapi.NKResponse(body="new"))
+    client = server.test_client(headers={"Origin": "http://example.com"})
+
+    for index in range(20):
+        response = client.options(f"/user/{index}")
+        assert response.headers["Access-Control-Allow-Methods"] == "DELETE, GET, OPTIONS"
+    assert client.options("/team/5").headers["Access-Control-Allow-Methods"] == "GET, OPTIONS"
+    assert client.options("/team/new").headers["Access-Control-Allow-Methods"] == "GET, OPTIONS, POST"
+    assert client.options("/nowhere/at/all").headers["Access-Control-Allow-Methods"] == "OPTIONS"
+    assert server.router.ambiguous_shapes() == {"/team/<param>", "/team/new"}